@@ -0,0 +1,330 @@
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from drive import OVERSAMPLING, Drive
+from engine import BLOCK_SIZES, SAMPLE_RATE, RenderEngine, make_params
+from instrumentation import AUDIT_WARMUP, AllocationError, Profiler, audit_block
+from render_pool import VoicePool
+
+##################################################
+## DSP benchmark: renders every case headless into a null sink and
+## reports real-time factor, per-block latency and temporary allocations
+##################################################
+
+WAVES = ["sinusoidal", "triangle", "sawtooth", "square", "noise"]
+FILTERS = ["lowpass", "highpass", "bandpass", "bandstop"]
+ORDERS = range(1, 13)
+BASE_CASE = {
+    "wave": "sinusoidal",
+    "ftype": None,
+    "order": 2,
+    "lfo": False,
+    "delay": False,
+    "block": 256,
+}
+
+
+class NullSink:
+    """Stands in for the audio device, with the callback's float32 buffer:
+    a float32 engine renders into it, a float64 engine's block is copied."""
+
+    def __init__(self, engine, block):
+        self.engine = engine
+        self.block = block
+        self.device = np.zeros(block, dtype=np.float32)
+
+    def render(self):
+        if self.engine.dtype == np.float32:
+            return self.engine.render_into(self.device)
+        np.copyto(self.device, self.engine.render(self.block))
+        return self.device
+
+
+def case_name(case):
+    return ",".join(f"{k}={v}" for k, v in case.items())
+
+
+def build_cases(full=False):
+    """Every case as a dict; ``full`` takes the whole cartesian product,
+    otherwise each dimension is swept on its own around BASE_CASE."""
+    if full:
+        filters = [(None, 2)] + list(itertools.product(FILTERS, ORDERS))
+        cases = []
+        for wave, (ftype, order), lfo, delay, block in itertools.product(
+            WAVES, filters, [False, True], [False, True], BLOCK_SIZES
+        ):
+            cases.append(
+                {
+                    "stage": "render",
+                    "wave": wave,
+                    "ftype": ftype,
+                    "order": order,
+                    "lfo": lfo,
+                    "delay": delay,
+                    "block": block,
+                }
+            )
+        return cases
+
+    sweeps = [{"wave": wave} for wave in WAVES]
+    sweeps += [{"ftype": f, "order": o} for f in FILTERS for o in ORDERS]
+    sweeps += [{"lfo": True}, {"delay": True}, {"reverb": True}]
+    sweeps += [{"drive": factor} for factor in OVERSAMPLING]
+    # the other modulation targets, each with the stage it moves
+    sweeps += [
+        {"lfo": True, "lfo_target": "pitch"},
+        {"lfo": True, "lfo_target": "cutoff", "ftype": "lowpass"},
+        {"lfo": True, "lfo_target": "delay_time", "delay": True},
+    ]
+    sweeps += [{"block": block} for block in BLOCK_SIZES]
+    cases = []
+    for sweep in sweeps:
+        case = {"stage": "render", **BASE_CASE, **sweep}
+        if case not in cases:
+            cases.append(case)
+
+    # the individual stages, at the base block size
+    for stage in ["get_waveform", "apply_filter", "envelope"]:
+        cases.append({"stage": stage, **BASE_CASE, "ftype": "lowpass"})
+    for factor in OVERSAMPLING:
+        cases.append({"stage": "drive", **BASE_CASE, "drive": factor})
+    return cases
+
+
+def make_engine(case, fs, voices, voice_workers=0, float32=False):
+    engine = RenderEngine(fs, n_voices=max(voices, 1), float32=float32)
+    if voice_workers:
+        engine.attach_pool(
+            VoicePool(fs, engine.voices.n_voices, voice_workers, deadline=None)
+        )
+    engine.params = make_params(
+        fs,
+        wave=case["wave"],
+        lfo=case["lfo"],
+        lfo_rate=5,
+        lfo_target=case.get("lfo_target", "amp"),
+        filter=case["ftype"] is not None,
+        ftype=case["ftype"] or "lowpass",
+        order=case["order"],
+        cutoff=1000,
+        bandwidth=100,
+        drive=bool(case.get("drive")),
+        drive_oversampling=case.get("drive") or 4,
+        delay=case["delay"],
+        reverb=case.get("reverb", False),
+    )
+    for i in range(voices):
+        engine.note_on(i, 110 * 2 ** (i / 12))
+    engine.handle_events(case["block"])
+    return engine
+
+
+def stage_function(case, engine, fs):
+    """Returns a callable running one block of the stage under test."""
+    block = case["block"]
+    stage = case["stage"]
+    if stage == "render":
+        return NullSink(engine, block).render
+
+    voices = engine.voices
+    idx = voices.active_voices()
+    if stage == "get_waveform":
+        return lambda: engine.get_waveform(
+            case["wave"], voices.phase[idx], voices.frequency[idx], block
+        )
+    if stage == "apply_filter":
+        # filtering works in place, every block starts from the same input
+        sig = np.random.rand(len(idx), block).astype(engine.dtype)
+        work = np.empty_like(sig)
+
+        def run():
+            np.copyto(work, sig)
+            return engine.apply_filter(engine.params, work, idx)
+
+        return run
+    if stage == "envelope":
+        lengths = engine.envelope_lengths(engine.params)
+        return lambda: engine.envelope.process(idx, block, *lengths)
+    if stage == "drive":
+        # the drive works in place too, on a full-scale block
+        params = engine.params
+        drive = Drive(params.drive_kernels, block, engine.dtype)
+        sig = (np.random.rand(block) * 2 - 1).astype(engine.dtype)
+        work = np.empty_like(sig)
+
+        def run():
+            np.copyto(work, sig)
+            return drive.process(work, params.drive_gain)
+
+        return run
+    raise ValueError(f"unknown stage {stage}")
+
+
+def run_case(
+    case,
+    fs=SAMPLE_RATE,
+    voices=8,
+    seconds=2.0,
+    warmup=10,
+    voice_workers=0,
+    float32=False,
+    audit=False,
+):
+    """Times one case. With ``audit`` a render case is then run under the
+    profiler's allocation audit, at ``audit_block`` samples a block, which
+    raises AllocationError if a block allocates."""
+    engine = make_engine(case, fs, voices, voice_workers, float32)
+    step = stage_function(case, engine, fs)
+    block = case["block"]
+    n_blocks = max(int(seconds * fs / block), 1)
+    deadline = block / fs
+
+    for _ in range(warmup):
+        step()
+
+    latencies = np.empty(n_blocks)
+    for i in range(n_blocks):
+        start = time.perf_counter()
+        step()
+        latencies[i] = time.perf_counter() - start
+
+    # temporary memory per block, measured in a separate pass because
+    # tracing slows everything down
+    tracemalloc.start()
+    peaks = np.empty(min(n_blocks, 50))
+    for i in range(len(peaks)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        step()
+        peaks[i] = tracemalloc.get_traced_memory()[1] - before
+    try:
+        if audit and case["stage"] == "render":
+            engine.profiler = Profiler(fs, audit=True)
+            audited = dict(case, block=audit_block(block, engine.dtype))
+            step = stage_function(audited, engine, fs)
+            for _ in range(AUDIT_WARMUP + 10):
+                step()
+    finally:
+        tracemalloc.stop()
+        engine.close()
+
+    return {
+        "name": case_name(case),
+        **case,
+        "voices": voices,
+        "rtf": float(deadline * n_blocks / latencies.sum()),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "max_ms": float(latencies.max() * 1000),
+        "deadline_ms": deadline * 1000,
+        "underruns": int((latencies > deadline).sum()),
+        "alloc_kib_per_block": float(np.median(peaks) / 1024),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Prints the p99 change of every case found in ``baseline``.
+
+    Returns the names of the cases slower than ``1 + tolerance`` times
+    their baseline.
+    """
+    previous = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        ratio = result["p99_ms"] / old["p99_ms"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(result["name"])
+            flag = "  REGRESSION"
+        print(f"{result['name']}: p99 x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the synth DSP headless.")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--full", action="store_true", help="cartesian product")
+    parser.add_argument("--filter", default="", help="only cases containing this")
+    parser.add_argument("--voices", type=int, default=8)
+    parser.add_argument(
+        "--voice-workers", type=int, default=0, help="render voices in processes"
+    )
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--rate", type=int, default=SAMPLE_RATE)
+    parser.add_argument(
+        "--float32", action="store_true", help="render in single precision"
+    )
+    parser.add_argument(
+        "--audit",
+        action="store_true",
+        help="fail the render cases that allocate once warmed up",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    failed = []
+    print(
+        f"{'case':84} {'rtf':>8} {'p50':>7} {'p99':>7} {'max':>7} {'xrun':>5} {'KiB':>7}"
+    )
+    for case in build_cases(args.full):
+        if args.filter not in case_name(case):
+            continue
+        try:
+            r = run_case(
+                case,
+                args.rate,
+                args.voices,
+                args.seconds,
+                voice_workers=args.voice_workers,
+                float32=args.float32,
+                audit=args.audit,
+            )
+        except AllocationError as e:
+            print(f"{case_name(case):84} ALLOCATES: {e}")
+            failed.append(case_name(case))
+            continue
+        results.append(r)
+        print(
+            f"{r['name']:84} {r['rtf']:8.1f} {r['p50_ms']:7.3f} {r['p99_ms']:7.3f} "
+            f"{r['max_ms']:7.3f} {r['underruns']:5d} {r['alloc_kib_per_block']:7.1f}"
+        )
+
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "rate": args.rate,
+            "voices": args.voices,
+            "voice_workers": args.voice_workers,
+            "float32": args.float32,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+
+##################################################
+## Scratch buffers: named arrays allocated once and reused by every
+## block, so a steady stream of blocks allocates nothing
+##################################################
+
+
+class ScratchBuffers:
+    """Flat buffers by name, handed out as views of the shape a block needs.
+
+    A buffer grows only when a larger shape is asked for, to
+    ``reserve`` rows at once, so after the first block of a given size
+    ``get`` returns views of memory that already exists.
+    """
+
+    def __init__(self, dtype=np.float64, reserve=1):
+        self.dtype = np.dtype(dtype)
+        self.reserve = reserve  # rows allocated whenever a 2-D buffer grows
+        self._buffers = {}
+
+    def get(self, name, *shape, dtype=None):
+        """A C-contiguous view of buffer ``name`` shaped ``shape``."""
+        dtype = self.dtype if dtype is None else dtype
+        size = math.prod(shape)
+        buffer = self._buffers.get(name)
+        if buffer is None or len(buffer) < size or buffer.dtype != dtype:
+            rows = max(shape[0], self.reserve) if len(shape) > 1 else 1
+            capacity = max(size, rows * math.prod(shape[1:]))
+            buffer = self._buffers[name] = np.zeros(capacity, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    def fill(self, name, shape, value, dtype=None):
+        """Buffer ``name`` of ``shape`` holding ``value``, broadcast and cast.
+
+        np.copyto broadcasts and casts without the temporary buffers numpy
+        allocates for a ufunc mixing shapes or dtypes, so the ufunc that
+        follows can run on operands of one shape and dtype.
+        """
+        buffer = self.get(name, *shape, dtype=dtype)
+        np.copyto(buffer, value, casting="unsafe")
+        return buffer
+
+    def ramp(self, n):
+        """0, 1, ..., n - 1 as floats, read-only."""
+        ramp = self._buffers.get("ramp")
+        if ramp is None or len(ramp) < n:
+            ramp = self._buffers["ramp"] = np.arange(n, dtype=np.float64)
+            ramp.setflags(write=False)
+        return ramp[:n]
+
+    def segments(self, n, step):
+        """(bounds, lengths) of ``n`` samples cut ``step`` at a time: the
+        edges 0, step, ..., n and the length between each pair, read-only."""
+        bounds = self._buffers.get(("bounds", step))
+        if bounds is None or bounds[-1] != n:
+            bounds = self._buffers["bounds", step] = np.append(np.arange(0, n, step), n)
+            self._buffers["lengths", step] = np.diff(bounds)
+            bounds.setflags(write=False)
+            self._buffers["lengths", step].setflags(write=False)
+        return bounds, self._buffers["lengths", step]
+
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
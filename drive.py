@@ -0,0 +1,100 @@
+import functools
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+
+##################################################
+## Drive: tanh saturation run at 2, 4 or 8 times the sample rate, between
+## polyphase FIR interpolation and decimation, so the harmonics it adds
+## above Nyquist are filtered out instead of folding back as aliases
+##################################################
+
+OVERSAMPLING = (2, 4, 8)  # the quality setting, CPU grows about linearly
+STOPBAND = 70.0  # dB of image and alias rejection
+PASSBAND = 0.75  # fraction of Nyquist kept flat, the rest is transition
+
+
+@functools.lru_cache(maxsize=None)
+def drive_kernels(factor):
+    """The lowpass for ``factor`` times oversampling, split into polyphase
+    matrices: (taps, factor) for interpolation, (factor, taps) for
+    decimation, each ordered for one matrix product per block."""
+    from scipy.signal import firwin, kaiserord
+
+    width = (1.0 - PASSBAND) / factor
+    n, beta = kaiserord(STOPBAND, width)
+    taps = -(-n // factor)
+    h = firwin(taps * factor, 1.0 / factor - width / 2, window=("kaiser", beta))
+    phases = h.reshape(taps, factor)  # phases[k, p] = h[k * factor + p]
+    # interpolation: each phase of the newest input sample comes last
+    interp = factor * phases[::-1]
+    # decimation: tap j of an oversampled row, newest sample first
+    decim = phases[::-1, ::-1].T
+    return np.ascontiguousarray(interp), np.ascontiguousarray(decim)
+
+
+class Drive:
+    """Saturates a signal ``block`` samples at a time, oversampled.
+
+    Every block is interpolated with one matrix product, of a window of
+    the input history by the polyphase kernel, shaped by tanh at the
+    oversampled rate, and decimated with another, whose diagonals add up
+    to the output samples. The histories carry both filters across blocks
+    and every buffer is allocated here.
+    """
+
+    def __init__(self, kernels, block, dtype=np.float64):
+        self.kernels = kernels
+        self.block = block
+        interp, decim = kernels
+        taps, factor = interp.shape
+        self.taps = taps
+        self.factor = factor
+        self.interp = interp.astype(dtype)
+        self.decim = decim.astype(dtype)
+        self.input = np.zeros(taps - 1 + block, dtype=dtype)
+        self.windows = np.zeros((block, taps), dtype=dtype)
+        self.upsampled = np.zeros((taps - 1 + block, factor), dtype=dtype)
+        self.products = np.zeros((taps - 1 + block, taps), dtype=dtype)
+        self.ones = np.ones(taps, dtype=dtype)
+        # views made once: windows[m, j] is input[m + j], and output m
+        # sums products[m + j, j] over j
+        self._input_windows = sliding_window_view(self.input, taps)
+        step = self.products.itemsize
+        self._diagonals = as_strided(
+            self.products, shape=(block, taps), strides=(taps * step, (taps + 1) * step)
+        )
+
+    @property
+    def latency(self):
+        """Delay of the two filters, in whole samples at the base rate.
+
+        Together they delay by taps * factor - 1 oversampled samples, and
+        decimation keeps the last phase of every base sample, factor - 1
+        past its start, which leaves taps - 1 base samples.
+        """
+        return self.taps - 1
+
+    def reset(self):
+        self.input[:] = 0.0
+        self.upsampled[:] = 0.0
+
+    def process(self, sig, gain):
+        """Drives ``sig`` in place by linear ``gain`` into tanh, scaled so a
+        full-scale peak stays at full scale, and returns it."""
+        block, taps = self.block, self.taps
+        self.input[: taps - 1] = self.input[block:]
+        self.input[taps - 1 :] = sig
+        self.upsampled[: taps - 1] = self.upsampled[block:]
+
+        shaped = self.upsampled[taps - 1 :]
+        # BLAS wants the overlapping windows laid out before the product
+        np.copyto(self.windows, self._input_windows)
+        np.matmul(self.windows, self.interp, out=shaped)
+        shaped *= gain
+        np.tanh(shaped, out=shaped)
+        shaped *= 1.0 / np.tanh(gain)
+
+        np.matmul(self.upsampled, self.decim, out=self.products)
+        np.matmul(self._diagonals, self.ones, out=sig)
+        return sig
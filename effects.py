@@ -0,0 +1,116 @@
+import numpy as np
+
+
+class DelayLine:
+    """Feedback delay effect backed by a preallocated circular buffer."""
+
+    # Shortest delay accepted, keeps the number of sub-blocks per chunk bounded
+    MIN_DELAY = 32
+
+    def __init__(
+        self, max_delay: int, block_size: int = 2048, dtype=np.float64
+    ) -> None:
+        self.max_delay = max_delay
+        self.dtype = np.dtype(dtype)
+        self.buffer = np.zeros(max_delay + 1, dtype=self.dtype)
+        self.write_pos = 0
+        self.delay = max_delay // 2
+        self.feedback = 0.5
+        self.mix = 0.5
+
+        # scratch buffers, reused every block
+        self._scratch(block_size)
+
+    def _scratch(self, n: int) -> None:
+        self._delayed = np.zeros(n, dtype=self.dtype)
+        self._feed = np.zeros(n, dtype=self.dtype)
+        self._next = np.zeros(n, dtype=self.dtype)
+        self._pos = np.zeros(n)
+        self._whole = np.zeros(n)
+        self._frac = np.zeros(n, dtype=self.dtype)
+        self._index = np.zeros(n, dtype=np.intp)
+        self._ramp = np.arange(n, dtype=float)
+
+    def set_params(self, delay: int, feedback: float, mix: float) -> None:
+        self.delay = int(min(max(delay, self.MIN_DELAY), self.max_delay))
+        self.feedback = feedback
+        self.mix = mix
+
+    def reset(self) -> None:
+        self.buffer[:] = 0.0
+        self.write_pos = 0
+
+    def _read(self, pos: int, out: np.ndarray) -> None:
+        n = len(out)
+        first = min(n, len(self.buffer) - pos)
+        out[:first] = self.buffer[pos : pos + first]
+        out[first:] = self.buffer[: n - first]
+
+    def _write(self, pos: int, data: np.ndarray) -> None:
+        n = len(data)
+        first = min(n, len(self.buffer) - pos)
+        self.buffer[pos : pos + first] = data[:first]
+        self.buffer[: n - first] = data[first:]
+
+    def _read_modulated(self, delays: np.ndarray, out: np.ndarray) -> None:
+        # fractional delays in samples, read with linear interpolation
+        m = len(out)
+        pos = self._pos[:m]
+        i0 = self._index[:m]
+        np.subtract(self._ramp[:m], delays, out=pos)
+        pos += self.write_pos
+        pos %= len(self.buffer)
+        whole = self._whole[:m]
+        np.modf(pos, out=(pos, whole))
+        np.copyto(i0, whole, casting="unsafe")
+        frac = self._frac[:m]
+        np.copyto(frac, pos)
+        np.take(self.buffer, i0, out=out, mode="wrap")
+        i0 += 1
+        following = self._next[:m]
+        np.take(self.buffer, i0, out=following, mode="wrap")
+        following -= out
+        following *= frac
+        out += following
+
+    def process(self, sig: np.ndarray, delays=None) -> np.ndarray:
+        """Mixes the delayed signal into ``sig`` in place and returns it.
+
+        ``delays`` optionally gives the delay of every sample, in samples,
+        for a modulated delay time; it is clipped to the line's range in
+        place.
+        """
+        n = len(sig)
+        if n > len(self._delayed):
+            self._scratch(n)
+        size = len(self.buffer)
+        dry = 1.0 - self.mix
+        step = self.delay
+        if delays is not None:
+            np.clip(delays, self.MIN_DELAY, self.max_delay - 1, out=delays)
+            # interpolation reads one sample past the delay
+            step = int(delays.min()) - 1
+
+        # A delay shorter than the block feeds back into the same block,
+        # so the block is processed in sub-blocks no longer than the delay.
+        start = 0
+        while start < n:
+            m = min(step, n - start)
+            x = sig[start : start + m]
+            delayed = self._delayed[:m]
+            feed = self._feed[:m]
+
+            if delays is None:
+                self._read((self.write_pos - self.delay) % size, delayed)
+            else:
+                self._read_modulated(delays[start : start + m], delayed)
+            np.multiply(delayed, self.feedback, out=feed)
+            feed += x
+            self._write(self.write_pos, feed)
+            self.write_pos = (self.write_pos + m) % size
+
+            x *= dry
+            delayed *= self.mix
+            x += delayed
+            start += m
+        return sig
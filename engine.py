@@ -0,0 +1,740 @@
+import time
+from queue import Empty, Queue
+
+import numpy as np
+
+from buffers import ScratchBuffers
+from drive import Drive, drive_kernels
+from effects import DelayLine
+from envelope import IDLE, EnvelopeGenerator
+from filters import SUB_BLOCK, FilterDesignCache, SOSFilterBank, design_sos
+from inputs import NoteEvent
+from instrumentation import Profiler
+from modulation import ModulationMatrix, make_modulation
+from notecache import VoiceStates
+from params import SynthParams
+from reverb import ConvolutionReverb, load_impulse
+from sampler import SampleLibrary
+from sequencer import EventScheduler
+from voices import VoiceBank
+from wavetable import WavetableBank
+
+SAMPLE_RATE = 44100
+SAMPLE_RATES = (44100, 48000, 96000)
+BLOCK_SIZES = (64, 128, 256, 512, 1024, 2048, 4096)
+VOICES = 16
+MAX_DELAY_TIME = 0.5  # seconds
+VOICE_TARGETS = ("pitch", "amp", "cutoff")  # modulation that makes notes differ
+
+
+def sustain_level(s_val):
+    """Maps the sustain knob (0-100) onto the 0.1-1 sustain level."""
+    return 10 ** (s_val / 100) / 10
+
+
+def make_params(
+    fs=SAMPLE_RATE,
+    wave="sinusoidal",
+    attack=250,
+    decay=250,
+    sustain=45,
+    release=500,
+    lfo=False,
+    lfo_rate=100,
+    lfo_amplitude=100,
+    lfo_offset=100,
+    lfo_shape="sine",
+    lfo_target="amp",
+    modulation=(),
+    filter=False,
+    ftype="low",
+    order=2,
+    cutoff=200,
+    bandwidth=10,
+    drive=False,
+    drive_gain=12,
+    drive_oversampling=4,
+    delay=False,
+    delay_time=250,
+    delay_feedback=50,
+    delay_mix=50,
+    reverb=False,
+    reverb_mix=30,
+    reverb_ir="",
+    filter_sos=None,
+):
+    """Builds a parameter snapshot from values in the GUI's slider units.
+
+    Times are in milliseconds, levels in percent, ``drive_gain`` in dB.
+    ``drive_oversampling`` is 2, 4 or 8, trading CPU for fewer aliases.
+    ``modulation`` adds
+    LFOs beyond the GUI's, as (shape, Hz, target, depth %) each.
+    ``filter_sos`` skips the filter design when the coefficients are known.
+    ``reverb_ir`` is a WAV impulse response, the built-in room when empty.
+    """
+    if filter_sos is None:
+        filter_sos = design_sos(ftype, order, cutoff, bandwidth, fs)
+    lfos, routes = make_modulation(
+        lfo, lfo_shape, lfo_rate, lfo_target, lfo_amplitude, modulation
+    )
+    return SynthParams(
+        wave=wave,
+        lfos=lfos,
+        routes=routes,
+        amp_offset=lfo_offset / 200 if lfo and lfo_target == "amp" else 1.0,
+        attack=attack / 1000,
+        decay=decay / 1000,
+        sustain=sustain_level(sustain),
+        release=release / 1000,
+        filter_on=filter,
+        ftype=ftype,
+        order=order,
+        cutoff=cutoff,
+        bandwidth=bandwidth,
+        filter_sos=filter_sos,
+        drive_on=drive,
+        drive_gain=10 ** (drive_gain / 20),
+        drive_kernels=drive_kernels(drive_oversampling) if drive else None,
+        delay_on=delay,
+        delay_time=min(delay_time / 1000, MAX_DELAY_TIME),
+        delay_feedback=delay_feedback / 100,
+        delay_mix=delay_mix / 100,
+        reverb_on=reverb,
+        reverb_mix=reverb_mix / 100,
+        reverb_impulse=load_impulse(reverb_ir, fs) if reverb else None,
+    )
+
+
+class RenderEngine:
+    """The synth's DSP chain, independent of Qt and of any audio device.
+
+    waveform -> LFO -> ADSR -> filter -> drive -> delay -> reverb, rendered block by block for
+    every active voice, with the LFOs of ``modulation`` moving pitch,
+    amplitude, cutoff and delay time. Note events are queued as NoteEvents and take
+    effect at a sample offset inside the next block; parameters come from
+    the ``params`` snapshot, which other threads may replace at any time.
+    With a VoicePool attached the voices render in other processes and
+    only the shared effects run here. ``samples`` is the directory of a
+    SampleLibrary played by the "sample" wave.
+
+    With ``float32`` every stage works in float32 instead of float64. Either
+    way blocks are computed in place in scratch buffers allocated on the
+    first block of a given size, and ``render_into`` writes the result into
+    a buffer of the caller's, so a steady stream of blocks allocates no
+    audio-sized memory (the sample wave excepted); ``profiler.audit``
+    checks that.
+
+    With a NoteCache, notes whose sound does not depend on when they are
+    played render in their own time, block by block from their note-on,
+    and those blocks are looked up in the cache before being synthesized;
+    see ``note_patch``.
+    """
+
+    def __init__(
+        self,
+        fs=SAMPLE_RATE,
+        n_voices=VOICES,
+        samples=None,
+        float32=False,
+        note_cache=None,
+    ):
+        self.fs = fs
+        self.dtype = np.dtype(np.float32 if float32 else np.float64)
+        self.params = SynthParams()
+        self.voices = VoiceBank(n_voices)
+        self.wavetables = WavetableBank.load(fs)
+        self.sampler = SampleLibrary(samples, fs) if samples else None
+        self.rng = np.random.default_rng()  # the noise wave
+        self.note_queue = Queue()
+        self.clock = 0  # samples rendered, the time base of scheduled events
+        self.scheduler = EventScheduler()
+        self.sequencers = []  # StepSequencers and Arpeggiators, see add_sequencer
+        self.scope = None  # optional ScopeBuffer receiving every rendered block
+
+        self.scratch = ScratchBuffers(self.dtype, reserve=n_voices)
+        self.modulation = ModulationMatrix(fs, self.dtype)
+        self.envelope = EnvelopeGenerator(n_voices, self.dtype)
+        self.filters = SOSFilterBank(n_voices, self.dtype)
+        self.filter_cache = FilterDesignCache(fs)  # designs for modulated cutoffs
+        # design a missing cutoff on the spot (offline), or make do with the
+        # nearest one until warm_filter's background designs are in (real time)
+        self.filter_wait = True
+        self._warmed = None  # (type, order, bandwidth) warm_filter designed
+        self._segment_sos = []  # coefficients per sub-block, reused
+        self.delay = DelayLine(max_delay=round(MAX_DELAY_TIME * fs), dtype=self.dtype)
+        self.delay_on = False  # delay state seen on the previous block
+        self.drive = None  # Drive for the current oversampling and block size
+        self.drive_on = False  # drive state seen on the previous block
+        self.reverb = None  # ConvolutionReverb for the current impulse and block size
+        self.reverb_on = False  # reverb state seen on the previous block
+        self.block_time = None  # perf_counter() at the start of the last block
+        self.pool = None  # optional VoicePool rendering the voices
+        self.dropped_pool = None  # one fallback took the voices from, to close
+
+        # voices played through the note cache: ``tape`` holds the previous
+        # and the latest block of each in note time, and the engine block
+        # is read from it ``tape_offset`` (the note-on offset) samples early
+        self.note_cache = None
+        self.taped = np.zeros(n_voices, dtype=bool)
+        self.tape_pending = np.full(n_voices, -1)  # note-on offset, taped next block
+        self.tape = None
+        self.tape_offset = np.zeros(n_voices, dtype=int)
+        self.tape_block = np.zeros(n_voices, dtype=int)  # latest block's index
+        self.tape_states = None  # VoiceStates at the start of the latest block
+        self.tape_patch = None  # note_patch and params the taped voices play
+        self.tape_params = None
+        self.tape_id = None  # the note cache's number for tape_patch
+        self.profiler = Profiler(fs)  # disabled until profiler.enabled is set
+        self.set_note_cache(note_cache)
+
+    def set_note_cache(self, cache):
+        """Plays notes through ``cache``, or None for no note cache.
+
+        The tapes are allocated here, for the cache's block size, so call it
+        between blocks and off the audio thread, like the cache's own
+        construction.
+        """
+        if self.taped.any():
+            self.untape(np.flatnonzero(self.taped), "note cache")
+        self.note_cache = cache
+        self.tape = self.tape_states = None
+        if cache is not None:
+            n = self.voices.n_voices
+            self.tape = np.zeros((n, 2 * cache.block), dtype=self.dtype)
+            self.tape_states = VoiceStates(n, cache.sections, self.dtype)
+
+    def post(self, event, target=None):
+        """Queues a NoteEvent, safe to call from any thread.
+
+        ``target(event, offset)`` receives it instead of the voices, an
+        arpeggiator's ``input`` for instance.
+        """
+        self.note_queue.put((event, target))
+
+    def schedule(self, sample, event, target=None):
+        """Applies ``event`` at sample ``sample`` of the engine clock.
+
+        Audio thread only (sequencers, event targets), or before rendering
+        starts (offline scores).
+        """
+        self.scheduler.schedule(sample, event, target or self.route)
+
+    def add_sequencer(self, sequencer):
+        sequencer.attach(self)
+        self.sequencers = self.sequencers + [sequencer]
+
+    def remove_sequencer(self, sequencer):
+        self.sequencers = [s for s in self.sequencers if s is not sequencer]
+
+    def note_on(self, note, frequency, offset=0):
+        self.post(NoteEvent("on", note, frequency, offset))
+
+    def note_off(self, note, offset=0):
+        self.post(NoteEvent("off", note, offset=offset))
+
+    def transpose(self, ratio):
+        self.post(NoteEvent("transpose", value=ratio))
+
+    def handle_events(self, chunk):
+        """Applies the queued and scheduled events due in the next block.
+
+        Timestamped events are played one block late, at the same distance
+        from the block start as they arrived after the previous one, which
+        keeps latency constant and removes block-sized jitter. Everything
+        then goes through the scheduler, so the block's events are applied
+        in sample order.
+        """
+        previous, self.block_time = self.block_time, time.perf_counter()
+        start, end = self.clock, self.clock + chunk
+        while True:
+            try:
+                event, target = self.note_queue.get_nowait()
+            except Empty:
+                break
+            offset = event.offset
+            if event.time is not None and previous is not None:
+                offset = int((event.time - previous) * self.fs)
+            offset = min(max(offset, 0), chunk - 1)
+            self.schedule(start + offset, event, target)
+
+        for sequencer in self.sequencers:
+            sequencer.schedule(start, end)
+        for sample, event, target in self.scheduler.pop_due(end):
+            target(event, max(sample - start, 0))
+        self.clock = end
+
+    def route(self, event, offset):
+        """Default event target: the voices, wherever they render."""
+        (self.pool or self).apply_event(event, offset)
+
+    def apply_event(self, event, offset):
+        if event.kind == "on":
+            if self.taped.any():
+                v = self.voices.voice_for(event.note)
+                if self.taped[v]:
+                    self.untape([v])
+            voice = self.voices.note_on(event.note, event.value)
+            # only a note starting from silence sounds the same every time
+            fresh = self.envelope.stage[voice] == IDLE
+            if self.note_cache is not None and fresh:
+                self.tape_pending[voice] = offset
+            # the oscillator runs from the block start, wound back so the
+            # note starts at phase 0 on its own sample
+            if self.params.wave == "sample" and self.sampler is not None:
+                # for samples the phase is the position in the file
+                phase = -offset * self.sampler.increment(event.value)
+            else:
+                phase = (-event.value * offset / self.fs) % 1.0
+            self.voices.phase[voice] = phase
+            self.envelope.note_on(voice, offset)
+        elif event.kind == "off":
+            voices = self.voices.note_off(event.note)
+            self.untape(voices[self.taped[voices]])
+            self.tape_pending[voices] = -1
+            self.envelope.note_off(voices, offset)
+        elif event.kind == "transpose":
+            self.untape(np.flatnonzero(self.taped))
+            self.tape_pending[:] = -1
+            self.voices.transpose(event.value)
+
+    def attach_pool(self, pool):
+        self.pool = pool
+
+    def fallback(self):
+        """Takes the voices back from the pool after it missed a deadline.
+
+        Held notes restart on the engine's own voices; notes already
+        released on the pool are cut. This runs on the audio thread, so the
+        pool is only counted and set aside, see take_dropped_pool.
+        """
+        pool, self.pool = self.pool, None
+        self.profiler.fallbacks += 1
+        for note, frequency in pool.held.items():
+            self.apply_event(NoteEvent("on", note, frequency), 0)
+        self.dropped_pool = pool
+
+    def take_dropped_pool(self):
+        """The pool ``fallback`` gave up on, once, for the caller to report
+        and close away from the audio thread; None if there is none."""
+        pool, self.dropped_pool = self.dropped_pool, None
+        return pool
+
+    def close(self):
+        for pool in (self.pool, self.take_dropped_pool()):
+            if pool is not None:
+                pool.close()
+        self.pool = None
+
+    def is_silent(self):
+        """True when a block would be all zeros and rendering can be skipped."""
+        if self.pool is not None and self.pool.busy():
+            return False
+        params = self.params
+        return not (self.voices.any_active() or params.delay_on or params.reverb_on)
+
+    def envelope_lengths(self, params):
+        """The envelope settings with the stage times in samples."""
+        fs = self.fs
+        return (
+            round(params.attack * fs),
+            round(params.decay * fs),
+            params.sustain,
+            round(params.release * fs),
+        )
+
+    def get_waveform(self, wave, phase, frequency, chunk, pitch=None, out=None):
+        """Returns one block per voice and the phase each voice ends on.
+
+        ``pitch`` is an optional per-sample frequency ratio. The block goes
+        into ``out`` when given, a scratch buffer otherwise.
+        """
+        if out is None:
+            out = self.scratch.get("oscillator", len(phase), chunk)
+        if wave == "noise":
+            self.rng.random(out=out, dtype=out.dtype)
+            out *= 0.707 * 2
+            out -= 1
+            return out, phase
+        if wave == "sample":
+            if self.sampler is None:
+                out[...] = 0.0
+                return out, phase
+            # gathered from the mapped files, this one allocates
+            block, end = self.sampler.render(phase, frequency, chunk, pitch)
+            out[...] = block
+            return out, end
+        return self.wavetables.render(
+            wave, phase, frequency, chunk, pitch, out, self.scratch
+        )
+
+    def cutoff_range(self):
+        """Lowest and highest cutoff a modulated filter is designed for."""
+        return 20.0, 0.45 * self.fs
+
+    def warm_filter(self, params):
+        """Designs in the background every cutoff the filter of ``params``
+        can be modulated to, once per filter type, order and bandwidth.
+
+        Called by whoever publishes the params, never on the audio thread,
+        which only looks designs up when ``filter_wait`` is off.
+        """
+        modulated = any(route.target == "cutoff" for route in params.routes)
+        if not (params.filter_on and modulated):
+            return
+        key = (params.ftype, params.order, params.bandwidth)
+        if key != self._warmed:
+            self._warmed = key
+            self.filter_cache.warm(*key, *self.cutoff_range(), response=False)
+
+    def filter_segments(self, params, octaves):
+        """Designs the filter for every SUB_BLOCK samples of a block whose
+        cutoff moves by ``octaves`` (one value per sample)."""
+        bounds, lengths = self.scratch.segments(len(octaves), SUB_BLOCK)
+        sums = self.scratch.get("octave sums", len(lengths), dtype=octaves.dtype)
+        np.add.reduceat(octaves, bounds[:-1], out=sums)
+        cutoffs = self.scratch.fill("cutoffs", (len(lengths),), sums, np.float64)
+        cutoffs /= lengths
+        np.exp2(cutoffs, out=cutoffs)
+        cutoffs *= params.cutoff
+        np.clip(cutoffs, *self.cutoff_range(), out=cutoffs)
+
+        sos_list = self._segment_sos
+        if len(sos_list) != len(cutoffs):
+            sos_list = self._segment_sos = [None] * len(cutoffs)
+        sos = params.filter_sos
+        for j, c in enumerate(cutoffs):
+            designed = self.filter_cache.sos(
+                params.ftype, params.order, c, params.bandwidth, self.filter_wait
+            )
+            if designed is not None:
+                sos = designed
+            sos_list[j] = sos
+        return sos_list, bounds
+
+    def apply_filter(self, params, sig, idx, cutoff=None):
+        """Filters a (voices x samples) block in place using the state of
+        voices ``idx``, and returns it.
+
+        With ``cutoff``, the per-sample cutoff modulation in octaves, the
+        coefficients follow it sub-block by sub-block. Designing the ones
+        missing from the cache is lapped as its own stage, which may
+        allocate.
+        """
+        if cutoff is None:
+            r = self.filters.process(params.filter_sos, sig, idx)
+        else:
+            misses = self.filter_cache.misses
+            sos_list, bounds = self.filter_segments(params, cutoff)
+            if self.filter_cache.misses != misses:
+                self.profiler.lap("filter design", allocates=True)
+            r = self.filters.process_segments(sos_list, bounds, sig, idx)
+        if params.ftype not in ["bandpass", "bandstop"]:
+            r *= 2
+        return r
+
+    def note_patch(self, params, chunk):
+        """Everything a voice's sound depends on, as part of a NoteCache
+        key, or None when notes do not sound the same every time: noise,
+        LFOs on pitch, amplitude or cutoff, a filter gliding between
+        coefficients."""
+        if params.wave == "noise" or self.pool is not None:
+            return None
+        if any(route.target in VOICE_TARGETS for route in params.routes):
+            return None
+        filtered = None
+        if params.filter_on:
+            sos = self.filters.sos
+            if sos is None or (
+                sos is not params.filter_sos
+                and not np.array_equal(sos, params.filter_sos)
+            ):
+                return None
+            filtered = (params.ftype, params.filter_sos.tobytes())
+        samples = (
+            self.sampler.path if params.wave == "sample" and self.sampler else None
+        )
+        return (
+            self.fs,
+            self.dtype.str,
+            chunk,
+            params.wave,
+            samples,
+            self.envelope_lengths(params),
+            filtered,
+        )
+
+    def untape(self, voices, stage="events"):
+        """Takes ``voices`` off the note cache, back to rendering in engine
+        time, before an event changes them.
+
+        A voice's latest block reaches ``tape_offset`` samples past the end
+        of the engine block; its state at the block end is found by
+        rendering again from the start of that block up to there. Replays
+        are profiled as the stages they run, apart from the calling ``stage``.
+        """
+        prof = self.profiler
+        for v in voices:
+            self.taped[v] = False
+            skip = self.tape_offset[v]
+            if skip:
+                prof.lap(stage)
+                self.tape_states.restore([v], self, [v])
+                prof.lap("note cache")
+                self.replay(v, self.tape.shape[1] // 2 - skip, self.tape_params)
+
+    def replay(self, v, n, params):
+        """Renders ``n`` samples of voice ``v`` for their effect on its state."""
+        idx = np.array([v])
+        voices = self.voices
+        prof = self.profiler
+        sig, voices.phase[idx] = self.get_waveform(
+            params.wave, voices.phase[idx], voices.frequency[idx], n
+        )
+        prof.lap("oscillator")
+        sig *= self.envelope.process(idx, n, *self.envelope_lengths(params))
+        prof.lap("envelope")
+        if params.filter_on:
+            self.apply_filter(params, sig, idx)
+            prof.lap("filter")
+
+    def play_tapes(self, chunk, params):
+        """Advances the voices on the note cache by a block.
+
+        Blocks found in the cache are copied onto the tapes with the state
+        they end on; the voices whose next block is missing are returned,
+        to be rendered with the others and stored by ``record_tapes``.
+        """
+        if params.filter_on:
+            self.filters.prepare(params.filter_sos)
+        cache = self.note_cache
+        patch = None
+        if cache.fits(chunk, self.dtype, self.filters.state.shape[1]):
+            patch = self.note_patch(params, chunk)
+        if patch != self.tape_patch and self.taped.any():
+            self.untape(np.flatnonzero(self.taped), "note cache")
+        pending = np.flatnonzero(self.tape_pending >= 0)
+        if patch is None:
+            self.tape_pending[pending] = -1
+            self.tape_patch = None
+            return pending[:0]
+
+        states = self.tape_states
+        self.tape_patch, self.tape_params = patch, params
+
+        # new notes start at phase 0 on the first sample of their own block
+        for v in pending:
+            offset = self.tape_pending[v]
+            self.tape_pending[v] = -1
+            if self.envelope.off_offset[v] >= 0:
+                continue  # a note-off earlier in the block, best left in place
+            self.tape_offset[v] = offset
+            self.tape_block[v] = -1
+            self.tape[v] = 0.0
+            self.voices.phase[v] = 0.0
+            self.envelope.on_offset[v] = 0
+            self.filters.reset(v)
+            self.taped[v] = True
+
+        taped = np.flatnonzero(self.taped)
+        if not len(taped):
+            return taped
+        # blocks are copied row by row, fancy indexing would copy them twice
+        for v in taped:
+            self.tape[v, :chunk] = self.tape[v, chunk:]
+        self.tape_block[taped] += 1
+        states.save(taped, self, taped)
+        self.tape_id = cache.patch_id(patch)
+        keys = zip(
+            self.voices.frequency[taped].tolist(), self.tape_block[taped].tolist()
+        )
+        slots = [cache.get((self.tape_id, f, k)) for f, k in keys]
+        hit = np.array([slot is not None for slot in slots], dtype=bool)
+        if hit.any():
+            found = [slot for slot in slots if slot is not None]
+            for v, slot in zip(taped[hit], found):
+                self.tape[v, chunk:] = cache.blocks[slot]
+            cache.states.restore(found, self, taped[hit])
+        return taped[~hit]
+
+    def record_tapes(self, chunk, voices, rows):
+        """Stores the freshly rendered blocks ``rows`` of taped ``voices``."""
+        cache = self.note_cache
+        keys = zip(
+            self.voices.frequency[voices].tolist(), self.tape_block[voices].tolist()
+        )
+        slots = [cache.put((self.tape_id, f, k)) for f, k in keys]
+        for v, slot, row in zip(voices, slots, rows):
+            cache.blocks[slot] = row
+            self.tape[v, chunk:] = row
+        cache.states.save(slots, self, voices)
+
+    def render(self, chunk):
+        """Handles pending note events and renders the next mono block.
+
+        The block is a scratch buffer, overwritten by the next call.
+        """
+        return self.render_into(self.scratch.get("output", chunk))
+
+    def render_into(self, out):
+        """Renders the next ``len(out)`` samples into ``out`` and returns it."""
+        chunk = len(out)
+        prof = self.profiler
+        prof.begin()
+        self.handle_events(chunk)
+        prof.lap("events")
+        if self.is_silent():
+            self.modulation.advance(self.params.lfos, chunk)
+            out[:] = 0.0
+            # the delay and reverb are off, and the drive has run dry: each
+            # starts afresh when it is next used
+            self.drive_on = self.delay_on = self.reverb_on = False
+            prof.end(chunk)
+            return out
+        params = self.params
+        mod = self.modulation.process(params.lfos, params.routes, chunk)
+        prof.lap("lfo")
+
+        mix = None
+        if self.pool is not None:
+            mix = self.pool.render(chunk, params, mod)
+            prof.lap("pool")
+            if mix is None:
+                self.fallback()
+            else:
+                out[:] = mix
+        if mix is None:
+            self.render_voices(chunk, params, mod, out)
+
+        # checkbox effects, the drive before the clipping it softens
+        if params.drive_on:
+            drive = self.drive
+            if (
+                drive is None
+                or drive.kernels is not params.drive_kernels
+                or drive.block != chunk
+            ):
+                drive = self.drive = Drive(params.drive_kernels, chunk, self.dtype)
+            elif not self.drive_on:
+                drive.reset()
+            drive.process(out, params.drive_gain)
+            prof.lap("drive")
+        self.drive_on = params.drive_on
+        np.clip(out, -1, 1, out=out)
+
+        if params.delay_on:
+            if not self.delay_on:
+                self.delay.reset()
+            self.delay.set_params(
+                round(params.delay_time * self.fs),
+                params.delay_feedback,
+                params.delay_mix,
+            )
+            delays = None
+            if "delay_time" in mod:
+                delays = self.scratch.fill(
+                    "delays", (chunk,), mod["delay_time"], np.float64
+                )
+                delays += params.delay_time
+                delays *= self.fs
+            self.delay.process(out, delays)
+            prof.lap("delay")
+        self.delay_on = params.delay_on
+
+        if params.reverb_on:
+            reverb = self.reverb
+            if (
+                reverb is None
+                or reverb.impulse is not params.reverb_impulse
+                or reverb.block != chunk
+            ):
+                reverb = self.reverb = ConvolutionReverb(
+                    params.reverb_impulse, chunk, self.dtype
+                )
+            elif not self.reverb_on:
+                reverb.reset()
+            reverb.process(out, params.reverb_mix)
+            prof.lap("reverb")
+        self.reverb_on = params.reverb_on
+
+        if self.scope is not None:
+            self.scope.write(out)
+            prof.lap("scope")
+
+        prof.end(chunk)
+        return out
+
+    def render_voices(self, chunk, params, mod=None, out=None):
+        """Renders and sums the active voices, before clipping and effects.
+
+        ``mod`` holds the block's modulation, as returned by
+        ``ModulationMatrix.process``. The sum goes into ``out`` when given.
+        """
+        voices = self.voices
+        prof = self.profiler
+        if out is None:
+            out = self.scratch.get("mix", chunk)
+        if not voices.any_active():
+            out[:] = 0.0
+            return out
+        mod = mod or {}
+
+        idx = voices.active_voices()
+        missing = None
+        if self.note_cache is not None:
+            missing = self.play_tapes(chunk, params)
+            # the voices off the cache, then the taped ones missing a block
+            idx = np.concatenate((idx[~self.taped[idx]], missing))
+            prof.lap("note cache")
+
+        out[:] = 0.0
+        if len(idx):
+            armed_signal = self.render_rows(chunk, params, mod, idx)
+            live = len(idx) if missing is None else len(idx) - len(missing)
+            if live < len(idx):
+                self.record_tapes(chunk, missing, armed_signal[live:])
+                prof.lap("note cache fill", allocates=True)
+            # row by row: the same sums as np.sum(axis=0), without its buffers
+            for row in armed_signal[:live]:
+                out += row
+        if missing is not None:
+            for v in np.flatnonzero(self.taped):
+                skip = self.tape_offset[v]
+                out += self.tape[v, chunk - skip : 2 * chunk - skip]
+        voices.advance(chunk)
+        voices.free(idx[self.envelope.finished(idx)])
+        prof.lap("mix")
+        return out
+
+    def render_rows(self, chunk, params, mod, idx):
+        """Renders one block of each voice in ``idx``, (voices x chunk)."""
+        voices = self.voices
+        prof = self.profiler
+        pitch = None
+        if "pitch" in mod:
+            # frequency ratios stay in float64, they accumulate into phases
+            pitch = self.scratch.fill("pitch", (chunk,), mod["pitch"], np.float64)
+            pitch /= 12
+            np.power(2.0, pitch, out=pitch)
+        armed_signal, voices.phase[idx] = self.get_waveform(
+            params.wave, voices.phase[idx], voices.frequency[idx], chunk, pitch
+        )
+        prof.lap("oscillator")
+
+        if "amp" in mod:
+            gain = self.scratch.fill("gain", armed_signal.shape, mod["amp"])
+            gain += params.amp_offset
+            armed_signal *= gain
+            prof.lap("amp")
+
+        armed_signal *= self.envelope.process(
+            idx, chunk, *self.envelope_lengths(params)
+        )
+        prof.lap("envelope")
+
+        if params.filter_on:
+            # freshly started voices must not inherit a previous note's state
+            self.filters.reset(idx[voices.played[idx] == 0])
+            self.apply_filter(params, armed_signal, idx, mod.get("cutoff"))
+            prof.lap("filter")
+
+        return armed_signal
@@ -0,0 +1,198 @@
+import numpy as np
+
+IDLE, ATTACK, DECAY, SUSTAIN, RELEASE = range(5)
+CURVE = 3.0  # steepness of the exponential segments
+GAIN = 0.707
+SUSTAIN_GLIDE = 256  # samples a held note takes to reach a new sustain level
+
+
+def segment_shape(x, out=None):
+    """Falls from 1 at x=0 to 0 at x=1 along an exponential curve."""
+    out = np.multiply(x, -CURVE, out=out)
+    np.exp(out, out=out)
+    out -= np.exp(-CURVE)
+    out /= 1 - np.exp(-CURVE)
+    return out
+
+
+def envelope_preview(attack, decay, sustain, release, hold):
+    """The envelope of a note released after attack + decay + hold samples."""
+    a = 1 - segment_shape(np.arange(attack) / max(attack, 1))
+    d = sustain + (1 - sustain) * segment_shape(np.arange(decay) / max(decay, 1))
+    s = np.full(hold, float(sustain))
+    r = sustain * segment_shape(np.arange(release + 1) / max(release, 1))
+    return GAIN * np.concatenate((a, d, s, r))
+
+
+class EnvelopeGenerator:
+    """Per-voice ADSR envelopes computed one block at a time.
+
+    Every stage is a segment ``target + (start - target) * shape(pos / length)``
+    so a block is filled in a handful of vectorized passes, one per stage
+    change, whatever the stage lengths. Note on/off take a sample offset
+    into the next block, and both attack and release start from the level
+    the voice is at, not from a fixed value. Blocks are computed in
+    ``dtype``.
+    """
+
+    def __init__(self, n_voices, dtype=np.float64):
+        self.n_voices = n_voices
+        self.dtype = np.dtype(dtype)
+        self.stage = np.zeros(n_voices, dtype=int)
+        self.pos = np.zeros(n_voices)  # samples into the current stage
+        self.length = np.full(n_voices, np.inf)
+        self.start = np.zeros(n_voices)
+        self.target = np.zeros(n_voices)
+        self.level = np.zeros(n_voices)
+        self.on_offset = np.full(n_voices, -1)  # pending note-on in the next block
+        self.off_offset = np.full(n_voices, -1)  # pending note-off in the next block
+
+        self.attack = self.decay = self.release = 0
+        self.sustain = 1.0
+
+        # scratch buffers, (voices x block), grown on demand
+        self._out = np.zeros((n_voices, 0), dtype=self.dtype)
+        self._x = np.zeros((n_voices, 0), dtype=self.dtype)
+        self._k = np.zeros((n_voices, 0), dtype=self.dtype)
+        self._column = np.zeros((n_voices, 0), dtype=self.dtype)
+        self._mask = np.zeros((n_voices, 0), dtype=bool)
+        self._mask2 = np.zeros((n_voices, 0), dtype=bool)
+        self._ramp = np.zeros(0)
+
+    def note_on(self, voice, offset=0):
+        self.on_offset[voice] = offset
+
+    def note_off(self, voices, offset=0):
+        self.off_offset[voices] = offset
+
+    def finished(self, idx):
+        """Mask of the voices in ``idx`` whose envelope has ended."""
+        return (self.stage[idx] == IDLE) & (self.on_offset[idx] < 0)
+
+    def _enter(self, voices, stage):
+        self.stage[voices] = stage
+        self.pos[voices] = 0
+        self.start[voices] = self.level[voices]
+        if stage == ATTACK:
+            self.target[voices] = 1.0
+            self.length[voices] = self.attack
+        elif stage == DECAY:
+            self.target[voices] = self.sustain
+            self.length[voices] = self.decay
+        elif stage == RELEASE:
+            self.target[voices] = 0.0
+            self.length[voices] = self.release
+        else:
+            level = self.sustain if stage == SUSTAIN else 0.0
+            self.start[voices] = self.target[voices] = self.level[voices] = level
+            self.length[voices] = np.inf
+
+    def _scratch(self, n):
+        if self._out.shape[1] < n:
+            shape = (self.n_voices, n)
+            self._out = np.zeros(shape, dtype=self.dtype)
+            self._x = np.zeros(shape, dtype=self.dtype)
+            self._k = np.zeros(shape, dtype=self.dtype)
+            self._column = np.zeros(shape, dtype=self.dtype)
+            self._mask = np.zeros(shape, dtype=bool)
+            self._mask2 = np.zeros(shape, dtype=bool)
+            self._ramp = np.arange(n, dtype=self.dtype)
+
+    def _spread(self, values, n):
+        # one value per voice copied along the block, so the arithmetic
+        # below runs on same-shaped operands, which numpy does not buffer
+        column = self._column[: len(values), :n]
+        np.copyto(column, values[:, None])
+        return column
+
+    def process(self, idx, n, attack, decay, sustain, release):
+        """Returns the (voices x n) envelope of voices ``idx`` for the next block.
+
+        Stage lengths are in samples. The result is a view of a scratch
+        buffer that is overwritten by the next call.
+        """
+        self.attack, self.decay, self.release = attack, decay, release
+        if sustain != self.sustain:
+            # a sustain change applies to voices decaying to or holding it,
+            # held voices glide to the new level instead of jumping
+            self.sustain = sustain
+            self.target[self.stage == DECAY] = sustain
+            holding = np.flatnonzero(self.stage == SUSTAIN)
+            self._enter(holding, DECAY)
+            self.length[holding] = SUSTAIN_GLIDE
+
+        self._scratch(n)
+        rows = len(idx)
+        out = self._out[:rows, :n]
+        x = self._x[:rows, :n]
+        k = self._k[:rows, :n]
+        mask = self._mask[:rows, :n]
+        mask2 = self._mask2[:rows, :n]
+        done = np.zeros(rows, dtype=int)
+
+        stage = self.stage[idx]
+        steady = (stage == SUSTAIN) | (stage == IDLE)
+        pending = (self.on_offset[idx] >= 0) | (self.off_offset[idx] >= 0)
+        if steady.all() and not pending.any():
+            # every voice holds a constant level, nothing to compute
+            np.copyto(out, self.level[idx, None])
+            out *= GAIN
+            self.pos[idx] += n
+            return out
+
+        while True:
+            # events due at the current position of each voice
+            on = self.on_offset[idx] == done
+            if on.any():
+                self._enter(idx[on], ATTACK)
+                self.on_offset[idx[on]] = -1
+            off = self.off_offset[idx] == done
+            if off.any():
+                sounding = idx[off & (self.stage[idx] != IDLE)]
+                self._enter(sounding, RELEASE)
+                self.off_offset[idx[off]] = -1
+            # stages that ran their length; zero-length stages fall through
+            for stage, following in (
+                (ATTACK, DECAY),
+                (DECAY, SUSTAIN),
+                (RELEASE, IDLE),
+            ):
+                ended = (self.stage[idx] == stage) & (self.pos[idx] >= self.length[idx])
+                if ended.any():
+                    self._enter(idx[ended], following)
+
+            remaining = n - done
+            if not remaining.any():
+                break
+
+            # each voice renders up to its next stage end or pending event
+            pos = self.pos[idx]
+            length = self.length[idx]
+            m = np.minimum(remaining, length - pos)
+            for offsets in (self.on_offset[idx], self.off_offset[idx]):
+                pending = offsets > done
+                m[pending] = np.minimum(m[pending], offsets[pending] - done[pending])
+            m = m.astype(int)
+
+            start = self.start[idx]
+            target = self.target[idx]
+            np.copyto(k, self._ramp[:n])
+            k -= self._spread(done, n)
+            np.add(k, self._spread(pos, n), out=x)
+            x /= self._spread(length, n)
+            np.clip(x, 0.0, 1.0, out=x)
+            segment_shape(x, out=x)
+            x *= self._spread(start - target, n)
+            x += self._spread(target, n)
+            np.greater_equal(k, 0, out=mask)
+            np.less(k, self._spread(m, n), out=mask2)
+            mask &= mask2
+            np.copyto(out, x, where=mask)
+
+            end = segment_shape(np.minimum((pos + m) / length, 1.0))
+            self.level[idx] = target + (start - target) * end
+            self.pos[idx] = pos + m
+            done += m
+
+        out *= GAIN
+        return out
@@ -0,0 +1,285 @@
+from collections import OrderedDict
+from threading import Lock, Thread
+
+import numpy as np
+
+from buffers import ScratchBuffers
+
+# scipy.signal takes longer to import than the rest of the synth together,
+# so it is imported where it is first used, off the startup path
+
+SUB_BLOCK = 32  # shortest stretch of samples filtered with one coefficient set
+MAX_SUB_BLOCKS = 8
+STEPS_PER_OCTAVE = 96  # quantization of cached cutoff and bandwidth values
+
+
+def _band_edges(cutoff, bandwidth, nyq):
+    low = max(cutoff - bandwidth * 0.5, 1.0)
+    high = min(cutoff + bandwidth * 0.5, nyq - 1.0)
+    return [low / nyq, high / nyq]
+
+
+def design_filter(ftype, order, cutoff, bandwidth, fs, analog=False, output="ba"):
+    """Designs the filter selected by the filter section controls.
+
+    Band filters are Butterworth around ``cutoff`` with ``bandwidth`` Hz;
+    low/high pass filters are Chebyshev type I with 12 dB ripple. Returns
+    (b, a) or, with ``output="sos"``, second-order sections.
+    """
+    from scipy.signal import butter, cheby1
+
+    nyq = 0.5 * fs  # max freq
+    if ftype in ["bandpass", "bandstop"]:
+        return butter(
+            order,
+            _band_edges(cutoff, bandwidth, nyq),
+            btype=ftype,
+            analog=analog,
+            output=output,
+        )
+    return cheby1(order, 12, cutoff / nyq, btype=ftype, analog=analog, output=output)
+
+
+def design_sos(ftype, order, cutoff, bandwidth, fs):
+    return design_filter(ftype, order, cutoff, bandwidth, fs, output="sos")
+
+
+def filter_response(ftype, order, cutoff, bandwidth, fs):
+    """Returns the (frequency, dB) curve of the analog prototype for plotting."""
+    from scipy.signal import freqs
+
+    b, a = design_filter(ftype, order, cutoff, bandwidth, fs, analog=True)
+    w, h = freqs(b, a)
+    if ftype not in ["bandpass", "bandstop"]:
+        h *= 2
+    return w * (fs / 2), 20 * np.log10(abs(h))
+
+
+def quantize(value):
+    """Snaps ``value`` to the STEPS_PER_OCTAVE logarithmic grid."""
+    return int(round(np.log2(value) * STEPS_PER_OCTAVE))
+
+
+def dequantize(step):
+    return 2 ** (step / STEPS_PER_OCTAVE)
+
+
+class FilterDesignCache:
+    """Bounded LRU cache of filter designs and their plotted responses.
+
+    Keys are (type, order, quantized cutoff, quantized bandwidth, sample
+    rate), so a slider drag mostly hits designs computed before or by the
+    background warm-up.
+    """
+
+    def __init__(self, fs, max_entries=1024):
+        self.fs = fs
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._warm_generation = 0
+
+    def _design(self, key, entry=None, response=True):
+        ftype, order, cutoff_step, bandwidth_step, fs = key
+        cutoff, bandwidth = dequantize(cutoff_step), dequantize(bandwidth_step)
+        if entry is None:
+            sos = design_sos(ftype, order, cutoff, bandwidth, fs)
+            # numpy keeps the buffer info of an array from its first export
+            # on; export it here, not in the filter bank's first sosfilt
+            memoryview(sos).release()
+            entry = (sos, None)
+        if response:
+            entry = (entry[0], filter_response(ftype, order, cutoff, bandwidth, fs))
+        return entry
+
+    def _lookup(self, key, count, response=True):
+        # entries designed for modulation hold no response until plotted
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                if entry[1] is not None or not response:
+                    return entry
+            elif count:
+                self.misses += 1
+
+        entry = self._design(key, entry, response)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get(self, ftype, order, cutoff, bandwidth):
+        """Returns (sos, (frequency, dB)) for the quantized settings."""
+        key = (ftype, order, quantize(cutoff), quantize(bandwidth), self.fs)
+        return self._lookup(key, count=True)
+
+    def sos(self, ftype, order, cutoff, bandwidth, design=True):
+        """Just the coefficients, skipping the response the plot needs.
+
+        Without ``design`` a miss returns None instead of waiting for scipy.
+        """
+        key = (ftype, order, quantize(cutoff), quantize(bandwidth), self.fs)
+        if not design:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                return entry[0]
+        return self._lookup(key, count=True, response=False)[0]
+
+    def warm(self, ftype, order, bandwidth, low=200, high=8000, response=True):
+        """Fills the cache for the whole cutoff range on a background thread.
+
+        A newer call supersedes a warm-up still in progress.
+        """
+        self._warm_generation += 1
+        generation = self._warm_generation
+        steps = range(quantize(low), quantize(high) + 1)
+        bandwidth_step = quantize(bandwidth)
+
+        def run():
+            for step in steps:
+                if generation != self._warm_generation:
+                    return
+                key = (ftype, order, step, bandwidth_step, self.fs)
+                self._lookup(key, False, response)
+
+        Thread(target=run, daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+def _load_sosfilt():
+    """scipy's biquad loop, filtering (rows x samples) in place with a
+    (rows x sections x 2) state, or the same through the public
+    ``sosfilt``, which copies, should the private module move."""
+    try:
+        from scipy.signal._sosfilt import _sosfilt
+
+        return _sosfilt
+    except ImportError:
+        from scipy.signal import sosfilt
+
+        def run(sos, x, zi):
+            y, z = sosfilt(sos, x, axis=1, zi=zi.swapaxes(0, 1))
+            x[...] = y
+            zi[...] = z.swapaxes(0, 1)
+
+        return run
+
+
+class SOSFilterBank:
+    """Cascade of biquad sections run on many voices at once.
+
+    Each voice keeps its own state per section, shape (voices, sections, 2),
+    and that state is carried over when the coefficients change. A change
+    is spread over the block by linearly interpolating the coefficients
+    across sub-blocks; stable biquads form a convex set, so every
+    intermediate section is stable too. Blocks are filtered in place, in
+    ``dtype``, through scratch buffers, so filtering allocates nothing
+    block-sized.
+    """
+
+    def __init__(self, n_voices, dtype=np.float64):
+        self.n_voices = n_voices
+        self.dtype = np.dtype(dtype)
+        self.sos = None  # coefficients in effect at the end of the last block
+        self.state = np.zeros((n_voices, 0, 2), dtype=self.dtype)
+        self.scratch = ScratchBuffers(self.dtype, reserve=n_voices)
+        self._sosfilt = None
+
+    def reset(self, idx):
+        """Clears the state of voices ``idx``."""
+        self.state[idx] = 0.0
+
+    def prepare(self, sos):
+        """Starts out with coefficients ``sos`` if none were used yet, as the
+        first ``process`` would."""
+        if self.sos is None:
+            self._match_sections(len(sos))
+            self.sos = sos
+
+    def _match_sections(self, n_sections):
+        # keep the state of the sections that exist before and after
+        state = np.zeros((self.n_voices, n_sections, 2), dtype=self.dtype)
+        kept = min(n_sections, self.state.shape[1])
+        state[:, :kept] = self.state[:, :kept]
+        self.state = state
+
+    def _gather_state(self, idx):
+        zi = self.scratch.get("zi", len(idx), self.state.shape[1], 2)
+        np.take(self.state, idx, axis=0, out=zi, mode="clip")
+        return zi
+
+    def _filter(self, sos, sig, lo, hi, zi):
+        # scipy's loop wants C-contiguous rows, a sub-block goes through a copy
+        if self._sosfilt is None:
+            self._sosfilt = _load_sosfilt()
+        sos = np.ascontiguousarray(sos, dtype=self.dtype)
+        whole = lo == 0 and hi == sig.shape[1] and sig.flags.c_contiguous
+        if whole and sig.dtype == self.dtype:
+            self._sosfilt(sos, sig, zi)
+            return
+        x = self.scratch.get("segment", len(sig), hi - lo)
+        x[...] = sig[:, lo:hi]
+        self._sosfilt(sos, x, zi)
+        sig[:, lo:hi] = x
+
+    def process(self, sos, sig, idx):
+        """Filters the (voices x samples) block ``sig`` of voices ``idx`` in
+        place and returns it."""
+        if self.sos is None or len(sos) != len(self.sos):
+            # order changed, there is nothing meaningful to interpolate from
+            self._match_sections(len(sos))
+            self.sos = sos
+
+        zi = self._gather_state(idx)
+        n = sig.shape[1]
+        if sos is self.sos or np.array_equal(sos, self.sos):
+            self._filter(sos, sig, 0, n, zi)
+        else:
+            n_sub = min(MAX_SUB_BLOCKS, max(1, n // SUB_BLOCK))
+            bounds = np.linspace(0, n, n_sub + 1).astype(int)
+            start_sos = self.sos
+            for j in range(n_sub):
+                s = start_sos + (sos - start_sos) * ((j + 1) / n_sub)
+                self._filter(s, sig, bounds[j], bounds[j + 1], zi)
+        self.state[idx] = zi
+        self.sos = sos
+        return sig
+
+    def process_segments(self, sos_list, bounds, sig, idx):
+        """Filters ``sig`` in place with ``sos_list[j]`` between ``bounds[j]``
+        and ``bounds[j + 1]``, for cutoffs that move inside the block.
+
+        The sections must all be of the same order. A run of the same
+        coefficients is filtered in one call.
+        """
+        if self.sos is None or len(sos_list[0]) != len(self.sos):
+            self._match_sections(len(sos_list[0]))
+
+        zi = self._gather_state(idx)
+        lo = 0
+        for j, sos in enumerate(sos_list):
+            if j + 1 < len(sos_list) and sos_list[j + 1] is sos:
+                continue
+            hi = bounds[j + 1]
+            self._filter(sos, sig, lo, hi, zi)
+            lo = hi
+        self.state[idx] = zi
+        self.sos = sos_list[-1]
+        return sig
@@ -25,27 +25,29 @@ class GUI:
         self.synth.mySlider1 = self.create_slider(
             "Attack",
             geo=(30, 40, 200, 30),
+            max=500,
             default=self.synth.a_knob,
             value_change=self.synth.change_knob,
         )
         self.synth.mySlider2 = self.create_slider(
             "Decay",
             geo=(30, 100, 200, 30),
-            max=11025,
+            max=250,
             default=self.synth.d_knob,
             value_change=self.synth.change_knob,
         )
         self.synth.mySlider3 = self.create_slider(
             "Sustain",
             geo=(30, 160, 200, 30),
-            max=11025,
+            min=0,
+            max=100,
             default=self.synth.s_knob,
             value_change=self.synth.change_knob,
         )
         self.synth.mySliderR = self.create_slider(
             "Release",
             geo=(30, 220, 200, 30),
-            max=11025,
+            max=500,
             default=self.synth.r_knob,
             value_change=self.synth.change_knob,
         )
@@ -82,7 +84,7 @@ class GUI:
             min=200,
             max=8000,
             default=200,
-            value_change=lambda: self.synth.set_filter(),
+            value_change=self.synth.request_filter,
         )
 
         self.synth.myLabelQ = self.create_label("Band Width", pos=(300, 290))
@@ -92,7 +94,7 @@ class GUI:
             min=10,
             max=1000,
             default=10,
-            value_change=lambda: self.synth.set_filter(),
+            value_change=self.synth.request_filter,
         )
 
         self.synth.myLabel7 = self.create_label("Filter Order", pos=(300, 350))
@@ -108,8 +110,58 @@ class GUI:
         self.synth.mySlider8 = self.create_slider(
             "delay",
             geo=(40, 550, 200, 30),
-            default=11025,
-            # value_change=self.synth.set_delay, # This is not needed
+            max=500,
+            default=250,
+            value_change=self.synth.publish_params,
+        )
+
+        self.synth.myLabelFb = self.create_label("Delay Feedback", pos=(650, 380))
+        self.synth.mySliderFb = self.create_slider(
+            "delay_feedback",
+            geo=(650, 410, 200, 30),
+            min=0,
+            max=95,
+            default=50,
+            value_change=self.synth.publish_params,
+        )
+        self.synth.myLabelMix = self.create_label("Delay Mix", pos=(650, 440))
+        self.synth.mySliderMix = self.create_slider(
+            "delay_mix",
+            geo=(650, 470, 200, 30),
+            min=0,
+            max=100,
+            default=50,
+            value_change=self.synth.publish_params,
+        )
+
+        self.synth.myLabelReverb = self.create_label("Reverb Mix", pos=(520, 380))
+        self.synth.mySliderReverb = self.create_slider(
+            "reverb_mix",
+            geo=(520, 410, 120, 30),
+            min=0,
+            max=100,
+            default=30,
+            value_change=self.synth.publish_params,
+        )
+
+        self.synth.myLabelDrive = self.create_label("Drive Gain", pos=(870, 415))
+        self.synth.mySliderDrive = self.create_slider(
+            "drive_gain",
+            geo=(870, 445, 200, 30),
+            min=0,
+            max=36,
+            default=12,
+            value_change=self.synth.publish_params,
+        )
+
+        self.synth.myLabelTempo = self.create_label("Tempo: 120 BPM", pos=(800, 510))
+        self.synth.mySliderTempo = self.create_slider(
+            "tempo",
+            geo=(650, 540, 200, 30),
+            min=40,
+            max=240,
+            default=120,
+            value_change=self.synth.set_tempo,
         )
 
     def create_slider(
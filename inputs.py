@@ -0,0 +1,162 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+##################################################
+## Note input: every source turns key presses or MIDI messages into
+## timestamped NoteEvents posted to the engine's queue, nothing polls
+##################################################
+
+
+@dataclass(frozen=True)
+class NoteEvent:
+    """A note on/off or transpose request for the audio engine.
+
+    ``time`` is a ``time.perf_counter()`` timestamp taken when the event was
+    received; the engine turns it into a sample offset within the block.
+    Events built without a timestamp use ``offset`` directly.
+    """
+
+    kind: str  # "on", "off" or "transpose"
+    note: Optional[int] = None
+    value: float = 0.0  # frequency for "on", ratio for "transpose"
+    offset: int = 0
+    time: Optional[float] = None
+
+
+def midi_to_frequency(note):
+    return 440.0 * 2 ** ((note - 69) / 12)
+
+
+class ComputerKeyboard:
+    """Maps computer keyboard keys to note events, whatever delivers the keys.
+
+    z s x d c v g b h n j m play one octave, p/o shift octaves up/down and
+    q quits. Repeated presses of a held key (auto-repeat, or the same key
+    coming from two sources) are ignored.
+    """
+
+    # teclas y notas parametrizadas
+    KEYS = ["z", "s", "x", "d", "c", "v", "g", "b", "h", "n", "j", "m"]
+    NOTES = [246, 261, 277, 293, 311, 329, 349, 369, 392, 415, 440, 466]
+    FIRST_NOTE = 59  # MIDI number of the "z" key, used as the note id
+
+    def __init__(self, post: Callable, on_quit: Callable = lambda: None) -> None:
+        self.post = post
+        self.on_quit = on_quit
+        self.octave = 1
+        self.held = set()
+
+    def press(self, name: str, timestamp: Optional[float] = None) -> None:
+        if name in self.held:
+            return
+        self.held.add(name)
+        now = time.perf_counter() if timestamp is None else timestamp
+
+        if name == "q":
+            print("closed")
+            self.on_quit()
+        elif name == "p":
+            self.octave *= 2
+            self.post(NoteEvent("transpose", value=2, time=now))
+        elif name == "o":
+            self.octave /= 2
+            self.post(NoteEvent("transpose", value=0.5, time=now))
+        elif name in self.KEYS:
+            i = self.KEYS.index(name)
+            frequency = self.NOTES[i] * self.octave
+            self.post(NoteEvent("on", self.FIRST_NOTE + i, frequency, time=now))
+
+    def release(self, name: str, timestamp: Optional[float] = None) -> None:
+        if name not in self.held:
+            return
+        self.held.discard(name)
+        now = time.perf_counter() if timestamp is None else timestamp
+        if name in self.KEYS:
+            note = self.FIRST_NOTE + self.KEYS.index(name)
+            self.post(NoteEvent("off", note, time=now))
+
+
+class KeyboardHookSource:
+    """Global key hooks through the ``keyboard`` module (needs root on Linux)."""
+
+    def __init__(self, keys: ComputerKeyboard) -> None:
+        self.keys = keys
+        self._hook = None
+
+    def start(self) -> None:
+        import keyboard
+
+        def on_key(event):
+            if event.event_type == keyboard.KEY_UP:
+                self.keys.release(event.name)
+            else:
+                self.keys.press(event.name)
+
+        self._hook = keyboard.hook(on_key)
+
+    def stop(self) -> None:
+        if self._hook is not None:
+            import keyboard
+
+            keyboard.unhook(self._hook)
+            self._hook = None
+
+
+class MidiSource:
+    """Note messages from a MIDI input port through python-rtmidi (ALSA, ...)."""
+
+    def __init__(self, post: Callable, port: Optional[str] = None) -> None:
+        self.post = post
+        self.port = port
+        self._midi_in = None
+
+    @staticmethod
+    def available_ports():
+        import rtmidi
+
+        return rtmidi.MidiIn().get_ports()
+
+    def start(self) -> None:
+        import rtmidi
+
+        midi_in = rtmidi.MidiIn()
+        ports = midi_in.get_ports()
+        if not ports:
+            raise OSError("No MIDI input ports found.")
+        index = ports.index(self.port) if self.port in ports else 0
+        midi_in.open_port(index)
+        midi_in.set_callback(self._on_message)
+        self._midi_in = midi_in
+
+    def _on_message(self, message, data=None):
+        now = time.perf_counter()
+        (status, *payload), _ = message
+        kind = status & 0xF0
+        if kind not in (0x80, 0x90) or len(payload) < 2:
+            return
+        note, velocity = payload[:2]
+        if kind == 0x90 and velocity > 0:
+            self.post(NoteEvent("on", note, midi_to_frequency(note), time=now))
+        else:
+            self.post(NoteEvent("off", note, time=now))
+
+    def stop(self) -> None:
+        if self._midi_in is not None:
+            self._midi_in.close_port()
+            self._midi_in = None
+
+
+class VirtualSource:
+    """Programmatic note input, for scripts and tests."""
+
+    def __init__(self, post: Callable) -> None:
+        self.post = post
+
+    def note_on(self, note: int, frequency: Optional[float] = None) -> None:
+        if frequency is None:
+            frequency = midi_to_frequency(note)
+        self.post(NoteEvent("on", note, frequency, time=time.perf_counter()))
+
+    def note_off(self, note: int) -> None:
+        self.post(NoteEvent("off", note, time=time.perf_counter()))
@@ -0,0 +1,219 @@
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+##################################################
+## Profiler: per-stage block timers, xrun counters, a deadline
+## histogram and a Chrome trace of the most recent blocks
+##################################################
+
+HISTOGRAM_BINS = 20  # 10% of the deadline each, the last bin collects the rest
+TRACE_CAPACITY = 65536
+AUDIT_SLACK = 8192  # numpy allocates ~0.5-2.5 KiB per call, up to ~4.5 KiB a stage
+AUDIT_BYTES = 4 * AUDIT_SLACK  # audited blocks are at least this large
+AUDIT_WARMUP = 4  # first blocks may allocate while the scratch buffers grow
+
+
+class AllocationError(RuntimeError):
+    """A block allocated memory while the allocation audit was on."""
+
+
+def audit_block(block, dtype):
+    """The block size to audit ``block`` at: its smallest multiple of at
+    least AUDIT_BYTES of ``dtype`` samples.
+
+    numpy's bookkeeping does not grow with the block but temporaries do,
+    so past that size even a quarter-block temporary exceeds the slack.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    return block * max(1, -(-AUDIT_BYTES // (block * itemsize)))
+
+
+class Profiler:
+    """Times the stages of every rendered block.
+
+    The engine calls ``begin()`` at the start of a block, ``lap(name)``
+    after each stage and ``end(chunk)`` when the block is done. While
+    disabled each call returns right away, so the hooks can stay in the
+    hot path. Timings are kept as running totals plus a ring of the most
+    recent stage spans, which ``export_trace`` writes as Chrome trace JSON
+    (load it in chrome://tracing or Perfetto).
+
+    With ``audit`` each stage's allocations are also traced, and a stage
+    allocating more than ``AUDIT_SLACK`` bytes after the warm-up blocks
+    raises AllocationError, unless it was lapped with ``allocates`` (a
+    cache filling up), which is only reported. Blocks smaller than
+    ``audit_block`` hide block-sized temporaries under the slack. Tracing
+    is slow, this is a debugging aid.
+    """
+
+    def __init__(self, fs, enabled=False, trace_capacity=TRACE_CAPACITY, audit=False):
+        self.fs = fs
+        self.enabled = enabled or audit
+        self.audit = audit
+        self.allocated = {}  # name -> most bytes a block allocated in the stage
+        self._traced = 0
+        self.stages = {}  # name -> stage id, in first-seen order
+        self.total = np.zeros(0)  # seconds per stage
+        self.worst = np.zeros(0)
+        self.blocks = 0
+        self.overruns = 0  # blocks that took longer than their duration
+        self.underflows = 0  # underflows reported by the audio device
+        self.fallbacks = 0  # voice pools that missed a deadline and were dropped
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        self.worst_load = 0.0
+
+        self.trace_stage = np.zeros(trace_capacity, dtype=np.int32)
+        self.trace_start = np.zeros(trace_capacity)
+        self.trace_duration = np.zeros(trace_capacity)
+        self.trace_index = 0  # spans recorded so far
+        self._origin = time.perf_counter()
+        self._block_start = self._last = 0.0
+
+    def reset(self):
+        self.__init__(self.fs, self.enabled, len(self.trace_stage), self.audit)
+
+    def _stage_id(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = len(self.stages)
+            self.total = np.append(self.total, 0.0)
+            self.worst = np.append(self.worst, 0.0)
+        return stage
+
+    def _record(self, name, start, end):
+        stage = self._stage_id(name)
+        duration = end - start
+        self.total[stage] += duration
+        if duration > self.worst[stage]:
+            self.worst[stage] = duration
+        i = self.trace_index % len(self.trace_stage)
+        self.trace_stage[i] = stage
+        self.trace_start[i] = start - self._origin
+        self.trace_duration[i] = duration
+        self.trace_index += 1
+
+    def _check(self, name, allocates=False):
+        # bytes allocated since the last check, at the peak
+        if self.blocks < AUDIT_WARMUP:
+            return
+        grown = tracemalloc.get_traced_memory()[1] - self._traced
+        if grown > self.allocated.get(name, 0):
+            self.allocated[name] = grown
+        if grown > AUDIT_SLACK and not allocates:
+            raise AllocationError(
+                f"block {self.blocks}: {name} allocated {grown} bytes"
+            )
+
+    def _rearm(self):
+        # the profiler's own bookkeeping is not counted
+        tracemalloc.reset_peak()
+        self._traced = tracemalloc.get_traced_memory()[0]
+
+    def begin(self):
+        if not self.enabled:
+            return
+        if self.audit:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._rearm()
+        self._block_start = self._last = time.perf_counter()
+
+    def lap(self, name, allocates=False):
+        """Closes the stage that started at the previous begin() or lap().
+
+        ``allocates`` exempts the stage from the audit, its allocations are
+        still reported.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.audit:
+            self._check(name, allocates)
+        self._record(name, self._last, now)
+        self._last = now
+        if self.audit:
+            self._rearm()
+
+    def end(self, chunk):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.audit:
+            self._check("block")
+        self._record("block", self._block_start, now)
+        load = (now - self._block_start) * self.fs / chunk
+        self.blocks += 1
+        if load > 1.0:
+            self.overruns += 1
+        self.worst_load = max(self.worst_load, load)
+        self.histogram[min(int(load * 10), HISTOGRAM_BINS - 1)] += 1
+
+    def underflow(self):
+        """Counts an underflow reported by the audio device."""
+        self.underflows += 1
+
+    def summary(self):
+        """Mean and worst milliseconds per stage, with the xrun counters."""
+        blocks = max(self.blocks, 1)
+        stages = {
+            name: {
+                "mean_ms": self.total[i] / blocks * 1000,
+                "max_ms": self.worst[i] * 1000,
+            }
+            for name, i in self.stages.items()
+        }
+        for name, allocated in self.allocated.items():
+            if name in stages:
+                stages[name]["max_alloc_bytes"] = allocated
+        return {
+            "blocks": self.blocks,
+            "overruns": self.overruns,
+            "underflows": self.underflows,
+            "fallbacks": self.fallbacks,
+            "worst_load": self.worst_load,
+            "load_histogram": self.histogram.tolist(),
+            "stages": stages,
+        }
+
+    def report(self):
+        """The summary as text, for the log or the on-screen overlay."""
+        s = self.summary()
+        lines = [
+            f"blocks {s['blocks']}  overruns {s['overruns']}  "
+            f"underflows {s['underflows']}  worst {s['worst_load']:.0%}"
+        ]
+        if s["fallbacks"]:
+            lines[0] += f"  pool fallbacks {s['fallbacks']}"
+        for name, stage in s["stages"].items():
+            line = (
+                f"{name:<11}{stage['mean_ms']:7.3f} ms  max {stage['max_ms']:7.3f} ms"
+            )
+            if "max_alloc_bytes" in stage:
+                line += f"  alloc {stage['max_alloc_bytes']:7d} B"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def export_trace(self, path):
+        """Writes the recorded spans as a Chrome trace JSON file."""
+        capacity = len(self.trace_stage)
+        count = min(self.trace_index, capacity)
+        first = self.trace_index - count
+        names = list(self.stages)
+        events = []
+        for n in range(first, self.trace_index):
+            i = n % capacity
+            events.append(
+                {
+                    "name": names[self.trace_stage[i]],
+                    "ph": "X",
+                    "ts": self.trace_start[i] * 1e6,
+                    "dur": self.trace_duration[i] * 1e6,
+                    "pid": 0,
+                    "tid": 0,
+                }
+            )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
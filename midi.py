@@ -0,0 +1,96 @@
+import struct
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _read_track(data):
+    """Returns the (tick, kind, a, b) events of one MTrk chunk."""
+    events = []
+    pos = 0
+    tick = 0
+    status = 0
+    while pos < len(data):
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        byte = data[pos]
+
+        if byte == 0xFF:  # meta event
+            meta = data[pos + 1]
+            length, pos = _read_varlen(data, pos + 2)
+            if meta == 0x51:
+                events.append(
+                    (tick, "tempo", int.from_bytes(data[pos : pos + 3], "big"), 0)
+                )
+            elif meta == 0x2F:
+                break
+            pos += length
+            continue
+        if byte in (0xF0, 0xF7):  # sysex
+            length, pos = _read_varlen(data, pos + 1)
+            pos += length
+            continue
+
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        # otherwise running status: reuse the previous status byte
+        kind = status & 0xF0
+        n_data = 1 if kind in (0xC0, 0xD0) else 2
+        a = data[pos]
+        b = data[pos + 1] if n_data == 2 else 0
+        pos += n_data
+
+        if kind == 0x90 and b > 0:
+            events.append((tick, "on", a, b))
+        elif kind == 0x80 or kind == 0x90:
+            events.append((tick, "off", a, b))
+    return events
+
+
+def read_midi(path):
+    """Reads the notes of a Standard MIDI File.
+
+    Returns a time-sorted list of (seconds, kind, note, velocity) where
+    ``kind`` is "on" or "off". All tracks and channels are merged and tempo
+    changes are honoured.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"MThd":
+        raise ValueError(f"{path} is not a MIDI file")
+    length, _, n_tracks, division = struct.unpack(">IHHH", data[4:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+
+    pos = 8 + length
+    raw = []
+    for _ in range(n_tracks):
+        chunk_type = data[pos : pos + 4]
+        (chunk_len,) = struct.unpack(">I", data[pos + 4 : pos + 8])
+        pos += 8
+        if chunk_type == b"MTrk":
+            raw.extend(_read_track(data[pos : pos + chunk_len]))
+        pos += chunk_len
+    raw.sort(key=lambda event: event[0])
+
+    # ticks -> seconds, following the tempo map
+    tempo = 500000  # microseconds per quarter note
+    last_tick = 0
+    seconds = 0.0
+    events = []
+    for tick, kind, a, b in raw:
+        seconds += (tick - last_tick) * tempo / (division * 1e6)
+        last_tick = tick
+        if kind == "tempo":
+            tempo = a
+        else:
+            events.append((seconds, kind, a, b))
+    return events
@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from buffers import ScratchBuffers
+
+##################################################
+## Modulation: free-running LFOs and a routing matrix that turns
+## them into per-sample offsets for pitch, amplitude, cutoff and
+## delay time
+##################################################
+
+RANDOM_STEPS = 256  # held values of the random shape, phases wrap at this many cycles
+_RANDOM = np.random.default_rng(0).uniform(-1.0, 1.0, RANDOM_STEPS)
+_RANDOM_BY_DTYPE = {np.dtype(t): _RANDOM.astype(t) for t in (np.float32, np.float64)}
+
+
+def _wrap(x, out):
+    # phase within the cycle, cast into the block's dtype
+    x %= 1.0
+    np.copyto(out, x)
+    return out
+
+
+def _sine(x, out, index):
+    _wrap(x, out)
+    out *= 2 * np.pi
+    return np.sin(out, out=out)
+
+
+def _triangle(x, out, index):
+    x += 0.25
+    _wrap(x, out)
+    out -= 0.5
+    np.abs(out, out=out)
+    out *= -4
+    out += 1
+    return out
+
+
+def _sawtooth(x, out, index):
+    x += 0.5
+    _wrap(x, out)
+    out *= 2
+    out -= 1
+    return out
+
+
+def _square(x, out, index):
+    # 1 for the first half of a cycle, -1 for the second
+    _wrap(x, out)
+    out *= 2
+    np.floor(out, out=out)
+    out *= -2
+    out += 1
+    return out
+
+
+def _random(x, out, index):
+    np.copyto(index, x, casting="unsafe")
+    index %= RANDOM_STEPS
+    return np.take(_RANDOM_BY_DTYPE[out.dtype], index, out=out, mode="clip")
+
+
+# every shape maps phase in cycles onto -1..1, starting at 0 and rising
+# like a sine where it can; each takes the phases ``x`` (float64, which
+# it may overwrite) and writes into ``out``, ``index`` is integer scratch
+# space of the same length
+SHAPES = {
+    "sine": _sine,
+    "triangle": _triangle,
+    "sawtooth": _sawtooth,
+    "square": _square,
+    "random": _random,
+}
+
+# route depth at 100%: semitones, gain, octaves and seconds
+FULL_SCALE = {"pitch": 12.0, "amp": 0.5, "cutoff": 2.0, "delay_time": 0.02}
+TARGETS = tuple(FULL_SCALE)
+
+
+@dataclass(frozen=True)
+class LFO:
+    shape: str = "sine"
+    rate: float = 1.0  # Hz
+
+
+@dataclass(frozen=True)
+class Route:
+    """Adds ``depth`` times LFO ``source`` to ``target``, in the target's
+    FULL_SCALE units."""
+
+    source: int
+    target: str
+    depth: float
+
+
+def make_modulation(lfo, shape, rate, target, amplitude, extra=()):
+    """Builds the LFOs and routes of a patch from slider values.
+
+    The GUI's LFO is always LFO 0, routed only while ``lfo`` is on, so the
+    phases of the ``extra`` LFOs, (shape, Hz, target, depth %) each, keep
+    their slots when it is toggled.
+    """
+    lfos = [LFO(shape, rate)]
+    routes = []
+    if lfo:
+        routes.append(Route(0, target, amplitude / 100 * FULL_SCALE.get(target, 0)))
+    for shape, rate, target, depth in extra:
+        routes.append(Route(len(lfos), target, depth / 100 * FULL_SCALE.get(target, 0)))
+        lfos.append(LFO(shape, rate))
+
+    for osc in lfos:
+        if osc.shape not in SHAPES:
+            raise ValueError(f"Unknown LFO shape {osc.shape!r}")
+    for r in routes:
+        if r.target not in FULL_SCALE:
+            raise ValueError(f"Unknown modulation target {r.target!r}")
+    return tuple(lfos), tuple(routes)
+
+
+class ModulationMatrix:
+    """Runs the LFOs of the current patch and sums their routes.
+
+    Each LFO keeps a phase accumulator that runs on whether or not notes
+    are playing, so the modulation does not restart with every note and
+    all voices move together. ``process`` returns one array of ``chunk``
+    samples per routed target, in ``dtype``; they are views of scratch
+    buffers overwritten by the next block.
+    """
+
+    def __init__(self, fs, dtype=np.float64):
+        self.fs = fs
+        self.phase = np.zeros(0)  # cycles, per LFO slot
+        self.scratch = ScratchBuffers(dtype)
+        self._mod = {}
+
+    def reset(self):
+        self.phase[:] = 0.0
+
+    def _increments(self, lfos):
+        if len(self.phase) < len(lfos):
+            self.phase = np.append(self.phase, np.zeros(len(lfos) - len(self.phase)))
+        return np.array([osc.rate for osc in lfos]) / self.fs
+
+    def advance(self, lfos, chunk):
+        """Moves the phases on by ``chunk`` samples without rendering."""
+        n = len(lfos)
+        self.phase[:n] += self._increments(lfos) * chunk
+        self.phase[:n] %= RANDOM_STEPS
+
+    def process(self, lfos, routes, chunk):
+        """Returns {target: per-sample offset} for the next block."""
+        mod = self._mod
+        mod.clear()
+        if not routes:
+            self.advance(lfos, chunk)
+            return mod
+        increments = self._increments(lfos)
+        scratch = self.scratch
+
+        # phases stay in float64, the shapes are computed in the block dtype
+        x = scratch.get("x", chunk, dtype=np.float64)
+        index = scratch.get("index", chunk, dtype=np.intp)
+        waves = {}
+        for s in {r.source for r in routes}:
+            np.multiply(scratch.ramp(chunk), increments[s], out=x)
+            x += self.phase[s]
+            wave = scratch.get(("wave", s), chunk)
+            waves[s] = SHAPES[lfos[s].shape](x, wave, index)
+
+        term = scratch.get("term", chunk)
+        for r in routes:
+            if r.target in mod:
+                np.multiply(waves[r.source], r.depth, out=term)
+                mod[r.target] += term
+            else:
+                out = scratch.get(("target", r.target), chunk)
+                mod[r.target] = np.multiply(waves[r.source], r.depth, out=out)
+
+        self.advance(lfos, chunk)
+        return mod
@@ -0,0 +1,146 @@
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+##################################################
+## Note cache: blocks of single notes rendered once per patch and pitch,
+## kept with the voice state they end on and replayed from memory
+##################################################
+
+NOTE_CACHE_BYTES = 64 * 2**20
+SECTIONS = 12  # filter sections of the GUI's highest order band filter
+# the Envelope arrays a voice's state is in, with their dtypes, copied
+# without a cast since numpy buffers casting copies
+ENVELOPE_FIELDS = {
+    "stage": int,
+    "pos": float,
+    "length": float,
+    "start": float,
+    "target": float,
+    "level": float,
+    "on_offset": int,
+}
+
+
+class VoiceStates:
+    """Saved synthesis state of single voices: oscillator phase, envelope
+    and filter state, enough to carry on rendering a voice from where the
+    state was saved. Entries and voices are sequences of indices."""
+
+    def __init__(self, n, sections, dtype):
+        self.phase = np.zeros(n)
+        self.envelope = {
+            name: np.zeros(n, dtype=dtype) for name, dtype in ENVELOPE_FIELDS.items()
+        }
+        self.zi = np.zeros((n, sections, 2), dtype=dtype)
+
+    def save(self, i, engine, v):
+        """Stores the state of ``engine``'s voices ``v`` in entries ``i``."""
+        self.phase[i] = engine.voices.phase[v]
+        for name, saved in self.envelope.items():
+            saved[i] = getattr(engine.envelope, name)[v]
+        # voice by voice, fancy indexing of 3-D slices buffers the copy
+        state = engine.filters.state
+        for entry, voice in zip(i, v):
+            self.zi[entry, : state.shape[1]] = state[voice]
+
+    def restore(self, i, engine, v):
+        """Puts the state in entries ``i`` back into ``engine``'s voices ``v``."""
+        engine.voices.phase[v] = self.phase[i]
+        for name, saved in self.envelope.items():
+            getattr(engine.envelope, name)[v] = saved[i]
+        state = engine.filters.state
+        for entry, voice in zip(i, v):
+            state[voice] = self.zi[entry, : state.shape[1]]
+
+
+class NoteCache:
+    """Rendered note blocks under an LRU memory budget.
+
+    Keys are (patch, pitch, block index), the patch being a number standing
+    for everything a voice's sound depends on (see ``patch_id`` and
+    ``RenderEngine.note_patch``), so a changed parameter makes new keys and
+    the blocks of old settings just age out; a patch's number goes with
+    its last block. Each entry holds a block of ``block`` samples and the
+    voice state at its end, for filters of up to ``sections`` sections, in
+    slots allocated here, all at once, so build it off the audio thread.
+    Not thread-safe: share it only between engines rendering one after
+    another.
+    """
+
+    def __init__(
+        self, block, dtype=np.float64, max_bytes=NOTE_CACHE_BYTES, sections=SECTIONS
+    ):
+        self.block = block
+        self.dtype = np.dtype(dtype)
+        self.sections = sections
+        self.max_bytes = max_bytes
+        slot_bytes = (block + 2 * sections) * self.dtype.itemsize + 8 * (
+            1 + len(ENVELOPE_FIELDS)
+        )
+        n = max(max_bytes // slot_bytes, 1)
+        self.blocks = np.zeros((n, block), dtype=self.dtype)
+        self.states = VoiceStates(n, sections, self.dtype)
+        self._slots = OrderedDict()  # key -> slot, least recently used first
+        self._free = list(range(n - 1, -1, -1))
+        self.patches = {}  # note_patch -> its number in keys
+        self._owners = {}  # number -> [note_patch, entries under it]
+        self._numbers = itertools.count()
+        self.hits = self.misses = 0
+
+    def fits(self, chunk, dtype, sections):
+        """Whether blocks of ``chunk`` samples of ``dtype`` through a filter
+        of ``sections`` sections can be cached here."""
+        return chunk == self.block and dtype == self.dtype and sections <= self.sections
+
+    def patch_id(self, patch):
+        """A small number for ``patch``, quicker to hash in every key."""
+        number = self.patches.get(patch)
+        if number is None:
+            number = self.patches[patch] = next(self._numbers)
+            self._owners[number] = [patch, 0]
+        return number
+
+    def get(self, key):
+        """The slot holding ``key``, or None."""
+        slot = self._slots.get(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self._slots.move_to_end(key)
+        self.hits += 1
+        return slot
+
+    def put(self, key):
+        """A slot for ``key``, the least recently used one if none is free."""
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+        # counted first, so evicting the patch's last older block keeps it
+        self._owners[key[0]][1] += 1
+        if self._free:
+            slot = self._free.pop()
+        else:
+            evicted, slot = self._slots.popitem(last=False)
+            owner = self._owners[evicted[0]]
+            owner[1] -= 1
+            if not owner[1]:
+                del self._owners[evicted[0]]
+                del self.patches[owner[0]]
+        self._slots[key] = slot
+        return slot
+
+    def nbytes(self):
+        states = self.states
+        return (
+            self.blocks.nbytes
+            + states.phase.nbytes
+            + sum(saved.nbytes for saved in states.envelope.values())
+            + states.zi.nbytes
+        )
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
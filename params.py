@@ -0,0 +1,53 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass(frozen=True, eq=False)
+class SynthParams:
+    """Immutable snapshot of every parameter the audio thread reads.
+
+    The GUI thread builds a new instance whenever a control changes and
+    swaps the reference in a single assignment; the audio thread grabs the
+    reference once per block, so it never sees a half-updated patch and
+    never touches a Qt widget.
+    """
+
+    wave: str = "sinusoidal"
+
+    # --- Modulation (see modulation.py) ---
+    lfos: tuple = ()  # LFO per slot, running even when nothing routes it
+    routes: tuple = ()  # Route from an LFO slot to a target
+    amp_offset: float = 1.0  # gain the amplitude routes swing around
+
+    # --- ADSR (stage lengths in seconds) ---
+    attack: float = 0.25
+    decay: float = 0.25
+    sustain: float = 0.28
+    release: float = 0.5
+
+    # --- Filter ---
+    filter_on: bool = False
+    ftype: str = "low"
+    order: int = 2
+    cutoff: float = 200.0  # Hz, the centre of cutoff modulation
+    bandwidth: float = 10.0
+    filter_sos: np.ndarray = field(
+        default_factory=lambda: np.array([[1.0, 0.0, 0.0, 1.0, 0.0, 0.0]])
+    )
+
+    # --- Drive ---
+    drive_on: bool = False
+    drive_gain: float = 4.0  # linear, into the tanh
+    drive_kernels: tuple = None  # drive.drive_kernels for the oversampling
+
+    # --- Delay ---
+    delay_on: bool = False
+    delay_time: float = 0.25  # seconds
+    delay_feedback: float = 0.5
+    delay_mix: float = 0.5
+
+    # --- Reverb ---
+    reverb_on: bool = False
+    reverb_mix: float = 0.3
+    reverb_impulse: object = None  # reverb.ImpulseResponse, loaded with the patch
@@ -0,0 +1,276 @@
+import json
+import os
+from dataclasses import asdict, dataclass, fields
+from threading import Lock, Thread
+from typing import Optional
+
+import numpy as np
+
+from engine import SAMPLE_RATE, make_params, sustain_level
+from envelope import envelope_preview
+from filters import FilterDesignCache
+from params import SynthParams
+
+##################################################
+## Patches: every sound setting in the GUI's slider units, stored as
+## JSON, and a preset bank that prepares each patch's DSP state ahead
+##################################################
+
+PRESETS_PATH = os.path.join(
+    os.path.expanduser("~"), ".config", "pyqt-synth", "presets.json"
+)
+BANK_VERSION = 2
+
+
+@dataclass(frozen=True)
+class Patch:
+    """A complete sound. Fields other than ``name`` are the keyword
+    arguments of ``engine.make_params``, in slider units: milliseconds for
+    times, percent for levels, so a patch sounds the same at any sample
+    rate."""
+
+    name: str = "Init"
+    wave: str = "sinusoidal"
+    attack: int = 250
+    decay: int = 250
+    sustain: int = 45
+    release: int = 500
+    lfo: bool = False
+    lfo_rate: int = 100
+    lfo_amplitude: int = 100
+    lfo_offset: int = 100
+    lfo_shape: str = "sine"
+    lfo_target: str = "amp"
+    modulation: tuple = ()  # further LFOs, (shape, Hz, target, depth %) each
+    filter: bool = False
+    ftype: str = "lowpass"
+    order: int = 2
+    cutoff: int = 200
+    bandwidth: int = 10
+    drive: bool = False
+    drive_gain: int = 12  # dB into the saturation
+    drive_oversampling: int = 4
+    delay: bool = False
+    delay_time: int = 250
+    delay_feedback: int = 50
+    delay_mix: int = 50
+    reverb: bool = False
+    reverb_mix: int = 30
+    reverb_ir: str = ""  # WAV impulse response, the built-in room when empty
+
+    def settings(self) -> dict:
+        settings = asdict(self)
+        del settings["name"]
+        return settings
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Patch":
+        unknown = set(data) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown patch settings: {', '.join(sorted(unknown))}")
+        if "modulation" in data:
+            # JSON turns the tuples into lists, patches must stay hashable
+            data = {**data, "modulation": tuple(map(tuple, data["modulation"]))}
+        return cls(**data)
+
+
+FACTORY_PRESETS = [
+    Patch(),
+    Patch(
+        "Soft Pad",
+        wave="triangle",
+        attack=450,
+        decay=250,
+        sustain=82,
+        release=500,
+        filter=True,
+        cutoff=1200,
+        order=2,
+    ),
+    Patch(
+        "Pluck",
+        wave="sawtooth",
+        attack=1,
+        decay=90,
+        sustain=5,
+        release=135,
+        filter=True,
+        cutoff=2500,
+        order=4,
+    ),
+    Patch(
+        "Square Bass",
+        wave="square",
+        attack=2,
+        decay=135,
+        sustain=63,
+        release=90,
+        filter=True,
+        cutoff=500,
+        order=3,
+    ),
+    Patch(
+        "Tremolo Organ",
+        wave="sinusoidal",
+        attack=7,
+        decay=2,
+        sustain=100,
+        release=68,
+        lfo=True,
+        lfo_rate=6,
+        lfo_amplitude=60,
+        lfo_offset=100,
+    ),
+    Patch(
+        "Echo Lead",
+        wave="sawtooth",
+        attack=5,
+        decay=113,
+        sustain=73,
+        release=227,
+        filter=True,
+        cutoff=3000,
+        delay=True,
+        delay_time=181,
+        delay_feedback=45,
+        delay_mix=35,
+    ),
+    Patch(
+        "Wobble Bass",
+        wave="sawtooth",
+        attack=2,
+        decay=90,
+        sustain=80,
+        release=90,
+        lfo=True,
+        lfo_rate=3,
+        lfo_amplitude=80,
+        lfo_shape="triangle",
+        lfo_target="cutoff",
+        modulation=(("sine", 5, "pitch", 2),),
+        filter=True,
+        cutoff=400,
+        order=4,
+    ),
+]
+
+
+def _from_samples(patch: dict) -> dict:
+    # version 1 banks stored times in samples at 44.1 kHz (release at half
+    # rate) and the sustain knob as 0-11025
+    patch = dict(patch)
+    for key, scale in [("attack", 1), ("decay", 1), ("release", 2), ("delay_time", 1)]:
+        if key in patch:
+            patch[key] = max(round(patch[key] * scale / 44.1), 1)
+    if "sustain" in patch:
+        patch["sustain"] = round(patch["sustain"] * 100 / 11025)
+    return patch
+
+
+def load_bank(path: str) -> list:
+    """Reads the patches of a ``{"patches": [...]}`` JSON file."""
+    with open(path) as f:
+        data = json.load(f)
+    patches = data["patches"]
+    if data.get("version", 1) < BANK_VERSION:
+        patches = [_from_samples(patch) for patch in patches]
+    return [Patch.from_dict(patch) for patch in patches]
+
+
+def save_bank(path: str, patches: list) -> None:
+    """Writes ``patches`` as JSON, replacing ``path`` only once complete."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        data = {"version": BANK_VERSION, "patches": [asdict(p) for p in patches]}
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def adsr_preview(fs: int, attack: int, decay: int, sustain: int, release: int):
+    """The envelope curve the ADSR plot shows, from slider values."""
+    a, d, r = (round(ms * fs / 1000) for ms in (attack, decay, release))
+    return envelope_preview(a, d, sustain_level(sustain), r, hold=fs // 4)
+
+
+@dataclass(frozen=True, eq=False)
+class PreparedPatch:
+    """Everything selecting a patch needs, computed before it is selected."""
+
+    patch: Patch
+    params: SynthParams
+    envelope: np.ndarray
+    filter_response: tuple
+
+
+class PresetBank:
+    """Named patches, each with its parameter snapshot, filter design and
+    envelope preview prepared once and kept until the patch changes.
+
+    Applying a prepared patch is a single ``engine.params`` assignment.
+    """
+
+    def __init__(
+        self,
+        fs: int = SAMPLE_RATE,
+        patches: Optional[list] = None,
+        filter_cache: Optional[FilterDesignCache] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        self.fs = fs
+        self.path = path  # where save() writes the bank
+        self.filter_cache = filter_cache or FilterDesignCache(fs)
+        self.patches = {}
+        for patch in FACTORY_PRESETS if patches is None else patches:
+            self.patches[patch.name] = patch
+        self._prepared = {}  # patch -> PreparedPatch
+        self._lock = Lock()
+
+    @classmethod
+    def load(cls, fs: int = SAMPLE_RATE, path: str = PRESETS_PATH, **kwargs):
+        """The factory presets plus the patches saved at ``path``, if any."""
+        patches = list(FACTORY_PRESETS)
+        if os.path.exists(path):
+            try:
+                patches += load_bank(path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Warning: could not read the presets in {path}: {e}")
+        return cls(fs, patches, path=path, **kwargs)
+
+    def names(self) -> list:
+        return list(self.patches)
+
+    def add(self, patch: Patch) -> None:
+        self.patches[patch.name] = patch
+
+    def save(self) -> None:
+        """Writes the patches that are not factory presets to ``path``."""
+        user = [p for p in self.patches.values() if p not in FACTORY_PRESETS]
+        save_bank(self.path or PRESETS_PATH, user)
+
+    def prepare(self, patch: Patch) -> PreparedPatch:
+        """Returns the prepared state of ``patch``, computing it on first use."""
+        with self._lock:
+            prepared = self._prepared.get(patch)
+        if prepared is not None:
+            return prepared
+
+        sos, response = self.filter_cache.get(
+            patch.ftype, patch.order, patch.cutoff, patch.bandwidth
+        )
+        params = make_params(self.fs, filter_sos=sos, **patch.settings())
+        envelope = adsr_preview(
+            self.fs, patch.attack, patch.decay, patch.sustain, patch.release
+        )
+        prepared = PreparedPatch(patch, params, envelope, response)
+        with self._lock:
+            self._prepared[patch] = prepared
+        return prepared
+
+    def __getitem__(self, name: str) -> PreparedPatch:
+        return self.prepare(self.patches[name])
+
+    def warm(self) -> None:
+        """Prepares every patch on a background thread."""
+        patches = list(self.patches.values())
+        Thread(target=lambda: [self.prepare(p) for p in patches], daemon=True).start()
@@ -0,0 +1,101 @@
+import time
+from functools import lru_cache
+
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from scope import decimate
+
+##################################################
+## Plotting: curves decimated to the widget width and redrawn at most
+## once per display frame, however often their data changes
+##################################################
+
+DEFAULT_REFRESH_RATE = 60.0
+
+
+@lru_cache(maxsize=32)
+def uniform_axis(n, dx, width):
+    """The x values matching ``decimate`` of ``n`` samples spaced ``dx``.
+
+    Cached and read-only, the same axis is handed to every redraw.
+    """
+    size = n // width
+    if size < 2:
+        x = np.arange(n) * dx
+    else:
+        # both points of a min/max pair sit at the start of their bucket
+        x = np.repeat(np.arange(width) * (size * dx), 2)
+    x.setflags(write=False)
+    return x
+
+
+class FrameScheduler(QObject):
+    """Runs queued GUI updates at most once per display refresh.
+
+    Requests with the same key made within a frame collapse into one call,
+    the latest, so a burst of slider events costs a single redraw. The
+    timer only runs while something is pending.
+    """
+
+    def __init__(self, parent=None, refresh_rate=None):
+        super().__init__(parent)
+        if refresh_rate is None:
+            screen = QApplication.primaryScreen()
+            refresh_rate = screen.refreshRate() if screen else 0
+        self.interval = 1.0 / (refresh_rate or DEFAULT_REFRESH_RATE)
+        self.pending = {}
+        self.last_flush = 0.0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def request(self, key, callback):
+        self.pending[key] = callback
+        if not self.timer.isActive():
+            wait = self.last_flush + self.interval - time.perf_counter()
+            self.timer.start(max(int(wait * 1000), 0))
+
+    def flush(self):
+        # requests made by the callbacks (a redraw after a recompute) run
+        # in the same frame
+        self.last_flush = time.perf_counter()
+        while self.pending:
+            pending, self.pending = self.pending, {}
+            for callback in pending.values():
+                callback()
+
+
+class Curve:
+    """A plotted line that decimates its data to the widget's pixel width.
+
+    ``set_data`` just keeps the newest data and asks the scheduler for a
+    redraw. With ``dx`` the samples are evenly spaced and the x-axis comes
+    from ``uniform_axis`` instead of being passed in.
+    """
+
+    def __init__(self, widget, scheduler, dx=None, **plot_kwargs):
+        self.widget = widget
+        self.scheduler = scheduler
+        self.dx = dx
+        self.item = widget.plot(**plot_kwargs)
+        self.x = self.y = None
+
+    def set_data(self, y, x=None):
+        self.x, self.y = x, y
+        self.scheduler.request(self, self.draw)
+
+    def draw(self):
+        if self.y is None:
+            return
+        width = max(self.widget.width(), 1)
+        y = decimate(self.y, width)
+        if self.dx is not None:
+            x = uniform_axis(len(self.y), self.dx, width)
+        elif len(y) == len(self.y):
+            x = self.x
+        else:
+            size = len(self.y) // width
+            x = np.repeat(self.x[: size * width : size], 2)
+        self.item.setData(x, y)
@@ -1,80 +1,114 @@
 import time
 from threading import current_thread
 
-import keyboard
 import numpy as np
 import pyaudio
 
+from engine import BLOCK_SIZES, RenderEngine
+from notecache import NoteCache
 
-def run_synth(synth):
-    t1 = current_thread()
+BLOCK_SIZE = 256
+UNDERFLOW_LIMIT = 2  # underflows per second before low-latency mode backs off
 
-    p = pyaudio.PyAudio()
 
-    chunk = 2048
-    stream = p.open(
-        format=pyaudio.paFloat32,
-        channels=1,
-        rate=synth.fs,
-        output=True,
-        frames_per_buffer=chunk,
-    )
+def probe_block_size(fs, n_voices, params, headroom=0.5, seconds=0.2, float32=False):
+    """Smallest block size that renders within ``headroom`` of its duration
+    (95th percentile) with every voice playing ``params``.
 
-    # teclas, notas y banderas de estado parametrizadas
-    keys = ["z", "s", "x", "d", "c", "v", "g", "b", "h", "n", "j", "m"]
-    flags = [False for _ in range(14)]
-    notes = [246, 261, 277, 293, 311, 329, 349, 369, 392, 415, 440, 466]
-    octave = 1
-    played_chunk = 0
+    Runs on a scratch engine, the live one is not touched. Rarer spikes are
+    left to the underflow back-off in ``run_synth``.
+    """
+    engine = RenderEngine(fs, n_voices, float32=float32)
+    engine.params = params
+    for size in BLOCK_SIZES:
+        for v in range(n_voices):
+            engine.note_on(v, 110 * 2 ** (v / 12))
+        for _ in range(4):  # warm-up
+            engine.render(size)
+        times = np.empty(max(int(seconds * fs / size), 8))
+        for i in range(len(times)):
+            start = time.perf_counter()
+            engine.render(size)
+            times[i] = time.perf_counter() - start
+        if np.percentile(times, 95) <= headroom * size / fs:
+            return size
+    return BLOCK_SIZES[-1]
 
-    # listener de presion de botones del teclado
-    while t1.do_run:
-        # time.sleep(0.002)
-        if keyboard.is_pressed("q") and not flags[-1]:
-            print("closed")
-            break
 
-        if keyboard.is_pressed("p") and not flags[-1]:
-            octave *= 2
-            flags[-1] = True
-        elif flags[-1] and not keyboard.is_pressed("p"):
-            flags[-1] = False
+def run_synth(synth):
+    t1 = current_thread()
+    engine = synth.engine
+    chunk = synth.block_size
+    if synth.low_latency:
+        # probe the patch the window starts with, not the engine's defaults;
+        # heavier patches later are left to the underflow back-off
+        while t1.do_run and not synth.ui_ready:
+            time.sleep(0.01)
+        chunk = probe_block_size(
+            synth.fs,
+            engine.voices.n_voices,
+            engine.params,
+            float32=engine.dtype == np.float32,
+        )
+
+    # PyAudio copies the buffer it is handed into the device's: a float32
+    # engine renders straight into this one, a float64 engine's block is
+    # converted into it, neither allocates a block
+    device = np.zeros(BLOCK_SIZES[-1], dtype=np.float32)
 
-        if keyboard.is_pressed("o") and not flags[-2]:
-            octave /= 2
-            flags[-2] = True
-        elif flags[-2] and not keyboard.is_pressed("o"):
-            flags[-2] = False
+    def callback(in_data, frame_count, time_info, status):
+        """PyAudio render callback, runs on the audio device thread."""
+        if status & pyaudio.paOutputUnderflow:
+            engine.profiler.underflow()
+        out = device[:frame_count]
+        if engine.dtype == np.float32:
+            engine.render_into(out)
+        else:
+            np.copyto(out, engine.render(frame_count))
+        return out, pyaudio.paContinue
 
-        for i, j in enumerate(keys):
-            if keyboard.is_pressed(j):
-                if not flags[i]:
-                    flags = [False for _ in range(14)]
-                    flags[i] = True
-                    played_chunk = 0
-                    release_chunk = 0
-                signal = synth.waveform(
-                    notes[i] * octave, played_chunk, release_chunk, chunk
-                )
-                data = signal.astype(np.float32)
-                stream.write(data, chunk)
-                played_chunk += 1
-            elif flags[i] and not keyboard.is_pressed(j):
-                signal = synth.waveform(
-                    notes[i] * octave, played_chunk, release_chunk, chunk
-                )
+    p = pyaudio.PyAudio()
+    while True:
+        synth.block_size = chunk
+        cache = engine.note_cache
+        if cache is not None and cache.block != chunk:
+            # no stream is open, the swap cannot race the callback
+            engine.set_note_cache(NoteCache(chunk, cache.dtype, cache.max_bytes))
+        print(f"audio: {chunk} sample blocks, {1000 * chunk / synth.fs:.1f} ms")
+        stream = p.open(
+            format=pyaudio.paFloat32,
+            channels=1,
+            rate=synth.fs,
+            output=True,
+            frames_per_buffer=chunk,
+            stream_callback=callback,
+        )
+        stream.start_stream()
+        if "audio" not in synth.startup.marks:
+            synth.startup.mark("audio")
 
-                data = signal.astype(np.float32)
-                stream.write(data, chunk)
-                release_chunk += 1
-                played_chunk += 1
-                if release_chunk > 17:
-                    flags[i] = False
-            else:
-                synth.set_counter()
-                # data = np.zeros(chunk).astype(np.float32)
-                # stream.write(np.zeros(chunk), chunk)
-                # time.sleep(0.00001)
+        # the device thread does all the work, this one just waits for
+        # shutdown and, in low-latency mode, for repeated underflows
+        underflows = engine.profiler.underflows
+        checked = time.monotonic()
+        grow = False
+        while t1.do_run and stream.is_active():
+            time.sleep(0.1)
+            if time.monotonic() - checked >= 1.0:
+                recent = engine.profiler.underflows - underflows
+                underflows = engine.profiler.underflows
+                checked = time.monotonic()
+                if (
+                    synth.low_latency
+                    and recent > UNDERFLOW_LIMIT
+                    and chunk < BLOCK_SIZES[-1]
+                ):
+                    grow = True
+                    break
 
-    stream.close()
+        stream.stop_stream()
+        stream.close()
+        if not grow:
+            break
+        chunk *= 2
     p.terminate()
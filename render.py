@@ -0,0 +1,289 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from engine import SAMPLE_RATE, RenderEngine, make_params
+from inputs import NoteEvent, midi_to_frequency
+from instrumentation import Profiler, audit_block
+from midi import read_midi
+from notecache import NOTE_CACHE_BYTES, NoteCache
+from patches import PresetBank
+from render_pool import VoicePool
+from sequencer import Arpeggiator, StepSequencer
+
+##################################################
+## Headless renderer: plays a JSON score or a MIDI file through the
+## synth engine and streams the result to a WAV file
+##################################################
+
+BLOCK_SIZE = 256
+DEFAULT_TAIL = 1.0  # seconds rendered after the last event
+# (budget, block size, dtype) -> NoteCache shared by the scores of a process
+_note_caches = {}
+
+# JSON score example:
+# {
+#     "patch": {"wave": "sawtooth", "filter": true, "cutoff": 1200},
+#     "notes": [
+#         {"time": 0.0, "duration": 0.5, "note": 60},
+#         {"time": 0.5, "duration": 0.5, "frequency": 440.0}
+#     ],
+#     "tail": 1.0
+# }
+# patch keys are the keyword arguments of engine.make_params. A score may
+# also hold a step sequence, and an arpeggiator playing its notes:
+#     "sequence": {"steps": [48, null, 55, 58], "bpm": 120, "repeats": 4},
+#     "arpeggiator": {"mode": "updown", "bpm": 120, "division": 4, "octaves": 2}
+# with the keyword arguments of sequencer.StepSequencer and Arpeggiator
+
+
+def load_score(path):
+    """Returns the patch settings, the sorted (time, kind, note, frequency)
+    events, the tail length and the sequencer settings of a JSON score or
+    MIDI file."""
+    if path.lower().endswith((".mid", ".midi")):
+        events = [
+            (seconds, kind, note, midi_to_frequency(note))
+            for seconds, kind, note, _ in read_midi(path)
+        ]
+        return {}, events, DEFAULT_TAIL, {}
+
+    with open(path) as f:
+        score = json.load(f)
+    events = []
+    for i, note in enumerate(score.get("notes", [])):
+        if "frequency" in note:
+            frequency = note["frequency"]
+        else:
+            frequency = midi_to_frequency(note["note"])
+        # every score note gets its own id so overlapping repeats don't collide
+        events.append((note["time"], "on", i, frequency))
+        events.append((note["time"] + note["duration"], "off", i, frequency))
+    events.sort(key=lambda event: event[0])
+    sequencing = {
+        key: score[key] for key in ("sequence", "arpeggiator") if key in score
+    }
+    return score.get("patch", {}), events, score.get("tail", DEFAULT_TAIL), sequencing
+
+
+def render_score(
+    engine,
+    events,
+    path,
+    block_size=BLOCK_SIZE,
+    tail=DEFAULT_TAIL,
+    target=None,
+    length=0.0,
+):
+    """Renders ``events`` block by block straight into a 16-bit WAV file.
+
+    The events are scheduled on the engine clock up front, so each takes
+    effect at its exact sample. ``target`` receives them instead of the
+    voices (an arpeggiator); ``length`` is the shortest duration before
+    the tail, for sequences outlasting the events. Returns the duration of
+    the rendered audio in seconds.
+    """
+    for seconds, kind, note, frequency in events:
+        event = NoteEvent(kind, note, frequency)
+        engine.schedule(round(seconds * engine.fs), event, target)
+    end = max(events[-1][0] if events else 0.0, length) + tail
+    n_blocks = int(np.ceil(end * engine.fs / block_size))
+    with wave.open(path, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(engine.fs)
+        for _ in range(n_blocks):
+            data = engine.render(block_size)
+            out.writeframes((np.clip(data, -1, 1) * 32767).astype("<i2").tobytes())
+    return n_blocks * block_size / engine.fs
+
+
+def render_file(
+    score,
+    path,
+    rate,
+    block_size,
+    override,
+    voice_workers=0,
+    profile=False,
+    samples=None,
+    float32=False,
+    audit=False,
+    note_cache=0,
+):
+    """Renders one score file to ``path``.
+
+    Returns the seconds of audio and the seconds it took. With
+    ``voice_workers`` the voices are spread over that many processes;
+    ``profile`` prints the stage timings and writes a Chrome trace next to
+    the WAV file. ``samples`` is the sample library the "sample" wave plays.
+    ``float32`` renders in single precision, ``audit`` raises
+    AllocationError if a block allocates, rendering in blocks of
+    ``audit_block`` samples. With ``note_cache`` bytes, notes are kept in
+    a NoteCache shared with the scores rendered after this one.
+    """
+    patch, events, tail, sequencing = load_score(score)
+    patch.update(override)
+    engine = RenderEngine(rate, samples=samples, float32=float32)
+    engine.params = make_params(rate, **patch)
+    if audit:
+        block_size = audit_block(block_size, engine.dtype)
+    cache = None
+    if note_cache:
+        key = (note_cache, block_size, engine.dtype)
+        cache = _note_caches.get(key)
+        if cache is None:
+            cache = _note_caches[key] = NoteCache(block_size, engine.dtype, note_cache)
+        engine.set_note_cache(cache)
+
+    target, length = None, 0.0
+    if "sequence" in sequencing:
+        sequence = StepSequencer(rate, **sequencing["sequence"])
+        if sequence.repeats is None:
+            raise ValueError(f"{score}: an offline sequence needs 'repeats'")
+        engine.add_sequencer(sequence)
+        length = sequence.duration()
+    if "arpeggiator" in sequencing:
+        arpeggiator = Arpeggiator(rate, **sequencing["arpeggiator"])
+        engine.add_sequencer(arpeggiator)
+        target = arpeggiator.input
+    engine.profiler = Profiler(rate, enabled=profile, audit=audit)
+    if voice_workers:
+        engine.attach_pool(
+            VoicePool(
+                rate,
+                engine.voices.n_voices,
+                voice_workers,
+                deadline=None,
+                samples=samples,
+            )
+        )
+
+    start = time.perf_counter()
+    try:
+        seconds = render_score(engine, events, path, block_size, tail, target, length)
+    finally:
+        engine.close()
+    elapsed = time.perf_counter() - start
+    if profile or audit:
+        print(f"{path}:\n{engine.profiler.report()}")
+        if cache is not None:
+            print(f"note cache: {cache.hit_rate():.0%} of blocks found")
+    if profile:
+        engine.profiler.export_trace(os.path.splitext(path)[0] + ".trace.json")
+    return seconds, elapsed
+
+
+def output_path(score, output, several):
+    name = os.path.splitext(os.path.basename(score))[0] + ".wav"
+    if output is None:
+        return os.path.join(os.path.dirname(score), name)
+    if several or os.path.isdir(output):
+        os.makedirs(output, exist_ok=True)
+        return os.path.join(output, name)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render JSON scores or MIDI files to WAV without a GUI or sound card."
+    )
+    parser.add_argument("scores", nargs="+", help="JSON score or .mid files")
+    parser.add_argument(
+        "-o", "--output", help="WAV file, or directory when rendering several scores"
+    )
+    parser.add_argument(
+        "--patch", help="JSON file with patch settings, over those of --preset"
+    )
+    parser.add_argument("--preset", help="name of a preset to render with")
+    parser.add_argument("--rate", type=int, default=SAMPLE_RATE)
+    parser.add_argument("--block", type=int, default=BLOCK_SIZE)
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="scores rendered in parallel"
+    )
+    parser.add_argument(
+        "--voice-workers",
+        type=int,
+        default=0,
+        help="processes sharing the voices of each score",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print stage timings and write a .trace.json next to each WAV",
+    )
+    parser.add_argument("--samples", help="sample library for the 'sample' wave")
+    parser.add_argument(
+        "--float32", action="store_true", help="render in single precision"
+    )
+    parser.add_argument(
+        "--audit",
+        action="store_true",
+        help="fail if a block allocates memory once warmed up (slow)",
+    )
+    parser.add_argument(
+        "--note-cache",
+        type=float,
+        default=0,
+        metavar="MB",
+        help=f"memory for notes rendered once and replayed, "
+        f"e.g. {NOTE_CACHE_BYTES // 2**20}; off by default",
+    )
+    args = parser.parse_args(argv)
+
+    override = {}
+    if args.preset:
+        override.update(PresetBank.load().patches[args.preset].settings())
+    if args.patch:
+        with open(args.patch) as f:
+            override = {**override, **json.load(f)}  # on top of the preset
+
+    paths = [output_path(s, args.output, len(args.scores) > 1) for s in args.scores]
+    jobs = [
+        (
+            score,
+            path,
+            args.rate,
+            args.block,
+            override,
+            args.voice_workers,
+            args.profile,
+            args.samples,
+            args.float32,
+            args.audit,
+            int(args.note_cache * 2**20),
+        )
+        for score, path in zip(args.scores, paths)
+    ]
+
+    start = time.perf_counter()
+    if args.jobs > 1:
+        with ProcessPoolExecutor(
+            args.jobs, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = list(executor.map(render_file, *zip(*jobs)))
+    else:
+        results = [render_file(*job) for job in jobs]
+    wall = time.perf_counter() - start
+
+    for path, (seconds, elapsed) in zip(paths, results):
+        print(
+            f"{path}: {seconds:.2f}s of audio in {elapsed:.2f}s "
+            f"({seconds / elapsed:.1f}x real time)"
+        )
+    if len(args.scores) > 1:
+        total_audio = sum(seconds for seconds, _ in results)
+        print(
+            f"total: {total_audio:.2f}s of audio in {wall:.2f}s "
+            f"({total_audio / wall:.1f}x real time)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import math
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+##################################################
+## Voice pool: spreads the synth voices over worker processes, each
+## one rendering its share of the notes into a shared-memory block
+##################################################
+
+MAX_BLOCK = 8192
+
+
+def _worker(conn, shm_name, row, fs, n_voices, max_block, samples):
+    """Worker process main loop: renders its voices on request."""
+    from engine import RenderEngine
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    out = np.ndarray(
+        (max_block,), dtype=np.float64, buffer=shm.buf, offset=row * max_block * 8
+    )
+    engine = RenderEngine(fs, n_voices, samples)
+    conn.send("ready")
+    try:
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            chunk, params, events, mod = job
+            if params is not None:
+                engine.params = params
+            for event in events:
+                engine.post(event)
+            engine.handle_events(chunk)
+            engine.render_voices(chunk, engine.params, mod, out[:chunk])
+            conn.send(engine.voices.any_active())
+    finally:
+        del out
+        shm.close()
+
+
+class VoicePool:
+    """Renders the voices of a RenderEngine in ``workers`` processes.
+
+    The engine routes every note to one worker, which owns a VoiceBank of
+    its own, and sums the workers' blocks before the shared effects. Blocks
+    come back through one shared-memory row per worker, only note events
+    and parameter snapshots are pickled. ``deadline`` is the fraction of
+    the block duration the workers get; a block not back by then makes
+    ``render`` return None so the caller can fall back to rendering
+    in-thread. ``deadline=None`` waits as long as it takes (offline use). Each
+    worker maps the sample library ``samples`` itself.
+    """
+
+    def __init__(
+        self,
+        fs,
+        n_voices,
+        workers=None,
+        deadline=0.5,
+        max_block=MAX_BLOCK,
+        samples=None,
+    ):
+        self.fs = fs
+        self.workers = workers or multiprocessing.cpu_count()
+        self.deadline = deadline
+        self.max_block = max_block
+        self.held = {}  # note -> frequency of the notes held on the pool
+        self.owner = {}  # note -> worker playing it
+
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self.workers * max_block * 8
+        )
+        self.blocks = np.ndarray(
+            (self.workers, max_block), dtype=np.float64, buffer=self._shm.buf
+        )
+        self.sounding = np.zeros(self.workers, dtype=bool)
+        self.load = np.zeros(self.workers, dtype=int)  # notes held per worker
+        self.events = [[] for _ in range(self.workers)]
+        self.sent_params = [None] * self.workers
+
+        # spawn, forking a process running Qt and audio threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        voices_each = math.ceil(n_voices / self.workers)
+        self.conns = []
+        self.processes = []
+        for row in range(self.workers):
+            conn, child = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(child, self._shm.name, row, fs, voices_each, max_block, samples),
+                daemon=True,
+            )
+            process.start()
+            self.conns.append(conn)
+            self.processes.append(process)
+        try:
+            for conn in self.conns:
+                conn.recv()  # "ready", the engines are built
+        except EOFError:
+            self.close()
+            raise RuntimeError("a voice pool worker failed to start") from None
+
+    def apply_event(self, event, offset):
+        """Routes a note event to the worker that plays (or will play) it."""
+        event = type(event)(event.kind, event.note, event.value, offset)
+        if event.kind == "on":
+            w = self.owner.get(event.note)
+            if w is None:
+                w = int(np.argmin(self.load))
+                self.owner[event.note] = w
+                self.load[w] += 1
+            self.held[event.note] = event.value
+            self.events[w].append(event)
+        elif event.kind == "off":
+            w = self.owner.pop(event.note, None)
+            if w is not None:
+                self.load[w] -= 1
+                self.held.pop(event.note, None)
+                self.events[w].append(event)
+        elif event.kind == "transpose":
+            self.held = {n: f * event.value for n, f in self.held.items()}
+            for events in self.events:
+                events.append(event)
+
+    def busy(self):
+        return bool(self.sounding.any()) or any(self.events)
+
+    def render(self, chunk, params, mod=None):
+        """Returns the sum of the workers' next blocks, None on a missed deadline.
+
+        ``mod`` is the block's modulation, computed once by the engine so
+        every worker follows the same LFOs.
+        """
+        if chunk > self.max_block:
+            raise ValueError(
+                f"block of {chunk} samples, the pool takes {self.max_block}"
+            )
+        busy = [w for w in range(self.workers) if self.sounding[w] or self.events[w]]
+        for w in busy:
+            new_params = None if self.sent_params[w] is params else params
+            self.conns[w].send((chunk, new_params, self.events[w], mod))
+            self.sent_params[w] = params
+            self.events[w] = []
+
+        end = None
+        if self.deadline is not None:
+            end = time.perf_counter() + self.deadline * chunk / self.fs
+        for w in busy:
+            if end is not None and not self.conns[w].poll(
+                max(end - time.perf_counter(), 0)
+            ):
+                return None
+            self.sounding[w] = self.conns[w].recv()
+        return self.blocks[busy, :chunk].sum(axis=0)
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self.blocks = None
+        self._shm.close()
+        self._shm.unlink()
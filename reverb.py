@@ -0,0 +1,149 @@
+import functools
+from threading import Lock
+
+import numpy as np
+
+from sampler import Zone
+
+##################################################
+## Reverb: convolution with an impulse response, uniformly partitioned
+## and run as overlap-save FFTs, so a block of any IR length costs the same
+##################################################
+
+ROOM_SECONDS = 2.0  # length of the built-in impulse response
+ROOM_SEED = 7
+
+
+def room_impulse(fs, seconds=ROOM_SECONDS):
+    """The built-in impulse response: noise decaying 60 dB over ``seconds``."""
+    n = int(seconds * fs)
+    rng = np.random.default_rng(ROOM_SEED)
+    return rng.standard_normal(n) * 10 ** (-3 * np.arange(n) / n)
+
+
+class ImpulseResponse:
+    """An impulse response at one sample rate, normalized to unit energy,
+    with its partition spectra cached per block size and dtype."""
+
+    def __init__(self, samples, fs):
+        self.fs = fs
+        energy = np.sqrt(np.sum(samples**2))
+        self.samples = samples / energy if energy > 0 else samples
+        self._spectra = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def spectra(self, block, dtype=np.float64):
+        """rfft of every ``block``-sample partition zero-padded to twice its
+        length, latest partition first, shape (partitions, block + 1)."""
+        key = (block, np.dtype(dtype))
+        with self._lock:
+            spectra = self._spectra.get(key)
+        if spectra is None:
+            from scipy.fft import rfft
+
+            n = -(-len(self.samples) // block)  # partitions, rounded up
+            parts = np.zeros((n, 2 * block), dtype=dtype)
+            parts[:, :block].flat[: len(self.samples)] = self.samples
+            # reversed, so the oldest input spectrum meets the last partition
+            spectra = np.ascontiguousarray(rfft(parts, axis=1)[::-1])
+            with self._lock:
+                self._spectra[key] = spectra
+        return spectra
+
+
+@functools.lru_cache(maxsize=8)
+def load_impulse(path, fs):
+    """The ImpulseResponse in WAV file ``path`` at rate ``fs``, the built-in
+    room for an empty path. Cached, so the GUI thread can load it before
+    the audio thread asks."""
+    if not path:
+        return ImpulseResponse(room_impulse(fs), fs)
+    zone = Zone(path, root=0)
+    zone.open()
+    samples = zone.gather(np.arange(zone.frames))
+    if zone.rate != fs:
+        from scipy.signal import resample_poly
+
+        samples = resample_poly(samples, fs, zone.rate)
+    return ImpulseResponse(samples, fs)
+
+
+def load_fft():
+    """scipy's real FFT and its inverse, writing into a given ``out``
+    array, or the same through the public ``scipy.fft``, which allocates,
+    should the private module move."""
+    try:
+        from scipy.fft._pocketfft.pypocketfft import c2r, r2c
+
+        def rfft(x, out):
+            r2c(x, out=out)
+
+        def irfft(x, out):
+            c2r(x, lastsize=len(out), forward=False, inorm=2, out=out)
+
+    except ImportError:
+        import scipy.fft
+
+        def rfft(x, out):
+            out[...] = scipy.fft.rfft(x)
+
+        def irfft(x, out):
+            out[...] = scipy.fft.irfft(x, len(out))
+
+    return rfft, irfft
+
+
+class ConvolutionReverb:
+    """Convolves a signal with an ImpulseResponse, ``block`` samples at a time.
+
+    Uniformly partitioned overlap-save: the impulse response is cut into
+    ``block``-sample partitions whose spectra are computed once, and every
+    block's input spectrum goes into a frequency-domain delay line. A block
+    then costs one rfft, one multiply-add per partition and one irfft
+    whatever the signal, all into buffers allocated here, and its output
+    is ready with the block itself: one block of latency.
+    """
+
+    def __init__(self, impulse, block, dtype=np.float64):
+        self.impulse = impulse
+        self.block = block
+        self.spectra = impulse.spectra(block, dtype)
+        partitions, bins = self.spectra.shape
+        # every input spectrum is stored twice, so the last ``partitions``
+        # of them are always one contiguous slice, oldest first
+        self.history = np.zeros((2 * partitions, bins), dtype=self.spectra.dtype)
+        self.slot = 0
+        self.input = np.zeros(2 * block, dtype=dtype)  # previous and current block
+        self.sum = np.zeros(bins, dtype=self.spectra.dtype)
+        self.output = np.zeros(2 * block, dtype=dtype)
+        self._rfft, self._irfft = load_fft()
+
+    def reset(self):
+        self.history[:] = 0.0
+        self.input[:] = 0.0
+        self.slot = 0
+
+    def process(self, sig, mix):
+        """Mixes the reverberated signal into ``sig`` in place and returns it."""
+        block = self.block
+        partitions = len(self.spectra)
+        self.input[:block] = self.input[block:]
+        self.input[block:] = sig
+
+        i = self.slot
+        self._rfft(self.input, self.history[i])
+        self.history[i + partitions] = self.history[i]
+        window = self.history[i + 1 : i + 1 + partitions]
+        np.einsum("pk,pk->k", window, self.spectra, out=self.sum)
+        self.slot = (i + 1) % partitions
+
+        # overlap-save: the first half of the inverse wrapped around
+        self._irfft(self.sum, self.output)
+        wet = self.output[block:]
+        wet *= mix
+        sig *= 1.0 - mix
+        sig += wet
+        return sig
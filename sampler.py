@@ -0,0 +1,348 @@
+import json
+import os
+import re
+import struct
+from collections import OrderedDict
+from queue import Queue
+from threading import Lock, Thread
+
+import numpy as np
+
+##################################################
+## Sampler: multisampled instruments played straight from memory-mapped
+## WAV or raw files, with the attack of each sample kept in memory
+##################################################
+
+MANIFEST = "library.json"
+ATTACK_SECONDS = 0.25  # start of every sample kept resident
+CACHE_BYTES = 64 * 2**20
+NOTE_NAMES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+# WAV format tag and bits per sample -> numpy dtype; 24-bit samples are
+# read as 3 bytes each and put together when they are gathered
+WAV_DTYPES = {
+    (1, 8): "u1",
+    (1, 16): "<i2",
+    (1, 24): "i3",
+    (1, 32): "<i4",
+    (3, 32): "<f4",
+    (3, 64): "<f8",
+}
+SCALE = {"u1": 1 / 128, "<i2": 1 / 2**15, "i3": 1 / 2**23, "<i4": 1 / 2**31}
+
+
+def read_wav_header(path):
+    """Returns (dtype, channels, rate, data offset, frames) of a WAV file."""
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk, size = struct.unpack("<4sI", header)
+            if chunk == b"fmt ":
+                data = f.read(size + size % 2)  # and the pad byte of an odd size
+                tag, channels, rate = struct.unpack("<HHI", data[:8])
+                bits = struct.unpack("<H", data[14:16])[0]
+                if tag == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE, the real tag is in the GUID
+                    tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (tag, channels, rate, bits)
+            elif chunk == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path}: data chunk before fmt")
+                tag, channels, rate, bits = fmt
+                dtype = WAV_DTYPES.get((tag, bits))
+                if dtype is None:
+                    raise ValueError(f"{path}: unsupported format {tag}/{bits}-bit")
+                frames = size // (channels * bits // 8)
+                return dtype, channels, rate, f.tell(), frames
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)  # chunks are word aligned
+
+
+def note_from_name(name):
+    """MIDI note in a file name: "60", "C4", "piano_F#3_soft" (C4 = 60)."""
+    if name.isdigit():
+        return int(name)
+    matches = re.findall(r"([A-G])([#b]?)(-?\d)", name)
+    if not matches:
+        return None
+    letter, accidental, octave = matches[-1]
+    shift = {"#": 1, "b": -1}.get(accidental, 0)
+    return 12 * (int(octave) + 1) + NOTE_NAMES[letter] + shift
+
+
+class Zone:
+    """One sample of the library, mapped into memory on first use.
+
+    Slicing the map is zero-copy; only the frames an interpolation needs
+    are gathered, so a block reads a few pages of a file however large
+    the file is.
+    """
+
+    def __init__(self, path, root, gain=1.0, loop=None, raw=None):
+        self.path = path
+        self.root = root  # MIDI note recorded in the file
+        self.gain = gain
+        self.loop = loop  # (start, end) frames, None plays the sample once
+        self.raw = raw  # {"dtype", "channels", "rate"} for headerless files
+        self.data = None
+        self.packed = False
+        self.scale = 1.0
+        self.offset = 0
+        self.rate = None
+        self.frames = 0
+        self._open_lock = Lock()
+
+    def open(self):
+        with self._open_lock:
+            if self.data is not None:
+                return self.data
+            if self.raw is None:
+                dtype, channels, rate, offset, frames = read_wav_header(self.path)
+            else:
+                dtype, channels = self.raw["dtype"], self.raw.get("channels", 1)
+                rate, offset = self.raw["rate"], self.raw.get("offset", 0)
+                item = np.dtype(dtype).itemsize * channels
+                frames = (os.path.getsize(self.path) - offset) // item
+            self.packed = dtype == "i3"
+            self.scale = SCALE.get(dtype, 1.0)
+            self.offset = 128 if dtype == "u1" else 0
+            shape = (frames, channels)
+            if self.packed:
+                shape, dtype = (frames, channels, 3), "u1"
+            self.rate = rate
+            self.frames = frames
+            if frames:
+                self.data = np.memmap(
+                    self.path, dtype=dtype, mode="r", offset=offset, shape=shape
+                )
+            else:
+                self.data = np.zeros(shape, dtype=dtype)
+            return self.data
+
+    def gather(self, index, data=None):
+        """Mono float frames at the integer positions ``index``."""
+        data = self.data if data is None else data
+        frames = data[index]
+        if self.packed:
+            b = frames.astype(np.int32)
+            frames = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+            frames -= (frames & 0x800000) << 1  # sign of the 24-bit value
+        out = frames.mean(axis=-1) if frames.shape[-1] > 1 else frames[..., 0]
+        out = out.astype(np.float64)
+        if self.offset:
+            out -= self.offset
+        out *= self.scale * self.gain
+        return out
+
+
+class SampleLibrary:
+    """Samples spread over the keyboard, each playing the notes nearest
+    its root.
+
+    A directory with a ``library.json`` manifest of
+    ``{"samples": [{"file", "root", "gain", "loop", "raw"}]}`` entries, or
+    just WAV files named after their note (``C4.wav``, ``60.wav``).
+    Nothing is read when the library is loaded: each file is mapped when
+    first played, and only the attack segments in the LRU cache stay
+    resident, up to ``cache_bytes``. Attacks are loaded at note-on, or
+    with ``wait`` off by a loader thread while the note plays from the
+    mapped file, so rendering never reads them in.
+    """
+
+    def __init__(self, path, fs, cache_bytes=CACHE_BYTES):
+        self.path = path
+        self.fs = fs
+        self.cache_bytes = cache_bytes
+        self.zones = self._scan(path)
+        if not self.zones:
+            raise ValueError(f"No samples found in {path}")
+        self.zones.sort(key=lambda zone: zone.root)
+        roots = np.array([zone.root for zone in self.zones], dtype=float)
+        self.bounds = (roots[1:] + roots[:-1]) / 2  # split between neighbours
+        self.attack = OrderedDict()  # zone number -> float32 attack frames
+        self.cached_bytes = 0
+        self._lock = Lock()
+        # load an attack when a note starts (offline), or queue it for the
+        # loader thread and play from the file until it is in (real time)
+        self.wait = True
+        self._requests = Queue()
+        self._requested = set()  # zone numbers queued for the loader
+        self._loader = None
+
+    @staticmethod
+    def _scan(path):
+        manifest = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                entries = json.load(f)["samples"]
+            return [
+                Zone(
+                    os.path.join(path, e["file"]),
+                    e["root"],
+                    e.get("gain", 1.0),
+                    tuple(e["loop"]) if e.get("loop") else None,
+                    e.get("raw"),
+                )
+                for e in entries
+            ]
+        zones = []
+        for name in sorted(os.listdir(path)):
+            stem, ext = os.path.splitext(name)
+            root = note_from_name(stem)
+            if ext.lower() == ".wav" and root is not None:
+                zones.append(Zone(os.path.join(path, name), root))
+        return zones
+
+    def zone_of(self, frequency):
+        """Zone number for every frequency."""
+        note = 69 + 12 * np.log2(np.maximum(frequency, 1e-3) / 440.0)
+        return np.searchsorted(self.bounds, note)
+
+    def increment(self, frequency):
+        """Source frames per output sample for one note, whose sample is
+        mapped and its attack preloaded here, at note-on."""
+        z = int(self.zone_of(np.array([frequency]))[0])
+        zone = self.zones[z]
+        zone.open()
+        self.preload(z)
+        return self._ratio(zone, frequency)
+
+    def preload(self, z):
+        """Maps zone ``z`` and loads its attack, or queues both for the
+        loader thread without ``wait``."""
+        if self.wait:
+            zone = self.zones[z]
+            zone.open()
+            self._attack(z, zone)
+            return
+        with self._lock:
+            if z in self.attack or z in self._requested:
+                return
+            self._requested.add(z)
+        if self._loader is None:
+            self._loader = Thread(target=self._load, daemon=True)
+            self._loader.start()
+        self._requests.put(z)
+
+    def _load(self):
+        while True:
+            z = self._requests.get()
+            zone = self.zones[z]
+            try:
+                zone.open()
+                self._attack(z, zone)
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not load {zone.path}: {e}")
+            with self._lock:
+                self._requested.discard(z)
+
+    def _ratio(self, zone, frequency):
+        return 2 ** ((69 + 12 * np.log2(frequency / 440.0) - zone.root) / 12) * (
+            zone.rate / self.fs
+        )
+
+    @staticmethod
+    def _attack_frames(zone):
+        return min(int(ATTACK_SECONDS * zone.rate), zone.frames)
+
+    def _cached(self, z):
+        """The attack of zone ``z`` if it is in the cache, else None."""
+        with self._lock:
+            attack = self.attack.get(z)
+            if attack is not None:
+                self.attack.move_to_end(z)
+            return attack
+
+    def _attack(self, z, zone):
+        """The cached attack of zone ``z``, loading it within the budget."""
+        attack = self._cached(z)
+        if attack is not None:
+            return attack
+        attack = zone.gather(np.arange(self._attack_frames(zone))).astype(np.float32)
+        with self._lock:
+            self.attack[z] = attack
+            self.cached_bytes += attack.nbytes
+            while self.cached_bytes > self.cache_bytes and len(self.attack) > 1:
+                _, old = self.attack.popitem(last=False)
+                self.cached_bytes -= old.nbytes
+        return attack
+
+    def warm(self):
+        """Maps every file and loads attacks until the cache is full, on a
+        background thread."""
+
+        def run():
+            for z, zone in enumerate(self.zones):
+                try:
+                    zone.open()
+                except (OSError, ValueError) as e:
+                    print(f"Warning: could not open {zone.path}: {e}")
+                    continue
+                if self.cached_bytes < self.cache_bytes:
+                    self._attack(z, zone)
+
+        Thread(target=run, daemon=True).start()
+
+    def render(self, position, frequency, chunk, pitch=None):
+        """Plays ``chunk`` samples for each voice.
+
+        ``position`` holds each voice's place in its sample, in source
+        frames; negative positions are still silent (notes starting inside
+        the block). ``pitch`` optionally scales the frequency per sample.
+        Returns the (voices x chunk) block and the positions the voices end
+        on.
+        """
+        out = np.zeros((len(position), chunk))
+        end = np.array(position, dtype=float)  # skipped voices stay put
+        steps = np.arange(chunk, dtype=float) if pitch is None else np.cumsum(pitch)
+        if pitch is not None:
+            steps -= pitch
+        total = chunk if pitch is None else steps[-1] + pitch[-1]
+
+        for v, z in enumerate(self.zone_of(frequency)):
+            zone = self.zones[z]
+            if zone.data is None:
+                # a transpose or pitch modulation moved the voice to an unmapped zone
+                self.preload(z)
+                if zone.data is None:
+                    continue
+            ratio = self._ratio(zone, frequency[v])
+            pos = position[v] + ratio * steps
+            end[v] = position[v] + ratio * total
+            if zone.loop is not None:
+                start, stop = zone.loop
+                over = pos >= stop
+                pos[over] = start + (pos[over] - start) % (stop - start)
+                if end[v] >= stop:
+                    end[v] = start + (end[v] - start) % (stop - start)
+
+            # frames before the start and past the end stay silent
+            playing = (pos >= 0) & (pos < zone.frames - 1)
+            if not playing.any():
+                continue
+            pos = pos[playing]
+            i0 = pos.astype(np.int64)
+            frac = pos - i0
+
+            lo, hi = int(i0.min()), int(i0.max()) + 2
+            attack = None
+            if hi <= self._attack_frames(zone):
+                attack = self._cached(z)
+                if attack is None:  # evicted since note-on, or still loading
+                    self.preload(z)
+                    attack = self._cached(z)
+            if attack is not None:
+                a, b = attack[i0], attack[i0 + 1]
+            else:
+                window = zone.data[lo:hi]  # zero-copy view of the mapped file
+                a = zone.gather(i0 - lo, window)
+                b = zone.gather(i0 + 1 - lo, window)
+            b = b - a
+            b *= frac
+            out[v, playing] = a + b
+        return out, end
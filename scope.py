@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class ScopeBuffer:
+    """Fixed-size ring of the most recent output samples for the scope.
+
+    Written by the audio thread only and read by the GUI thread only, so it
+    needs no lock: the writer fills the samples first and then publishes
+    the new ``write_index`` in a single assignment. Every sample is stored
+    twice, at ``i`` and ``i + capacity``, which keeps the newest ``n``
+    samples one contiguous slice that readers get as a view, without
+    copying. A view may be overwritten while it is drawn, which a scope can
+    live with.
+    """
+
+    def __init__(self, capacity: int = 8192) -> None:
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=np.float32)
+        self.write_index = 0  # total samples written so far
+
+    def write(self, block: np.ndarray) -> None:
+        c = self.capacity
+        block = block[-c:]
+        n = len(block)
+        pos = self.write_index % c
+        first = min(n, c - pos)
+        rest = n - first
+        self.data[pos : pos + first] = block[:first]
+        self.data[pos + c : pos + c + first] = block[:first]
+        self.data[:rest] = block[first:]
+        self.data[c : c + rest] = block[first:]
+        self.write_index += n
+
+    def latest(self, n: int) -> np.ndarray:
+        """View of the newest ``n`` samples (``n`` <= capacity)."""
+        return self.window(self.write_index, n)
+
+    def window(self, end: int, n: int) -> np.ndarray:
+        """View of the ``n`` samples written before write index ``end``,
+        which must be among the newest ``capacity``."""
+        stop = end % self.capacity + self.capacity
+        return self.data[stop - n : stop]
+
+    def triggered(self, n: int) -> np.ndarray:
+        """View of ``n`` samples starting at a rising zero crossing.
+
+        The crossing is looked for in the older part of the buffer so a full
+        window follows it; without one the newest samples are returned.
+        """
+        search = min(n, self.capacity - n)
+        window = self.latest(n + search)
+        rising = np.flatnonzero((window[: search - 1] < 0) & (window[1:search] >= 0))
+        if len(rising) == 0:
+            return window[search:]
+        start = rising[-1] + 1
+        return window[start : start + n]
+
+
+def decimate(data: np.ndarray, width: int) -> np.ndarray:
+    """Reduces ``data`` to a min/max pair per bucket, ``2 * width`` points.
+
+    Peaks survive the reduction, unlike plain striding.
+    """
+    size = len(data) // width
+    if size < 2:
+        return data
+    buckets = data[: size * width].reshape(width, size)
+    out = np.empty((width, 2), dtype=data.dtype)
+    buckets.min(axis=1, out=out[:, 0])
+    buckets.max(axis=1, out=out[:, 1])
+    return out.ravel()
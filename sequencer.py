@@ -0,0 +1,195 @@
+import heapq
+import itertools
+import random
+from typing import Optional
+
+from inputs import NoteEvent, midi_to_frequency
+
+##################################################
+## Sequencing: events scheduled on the engine's sample clock, a step
+## sequencer and an arpeggiator, the same live and offline
+##################################################
+
+ARP_MODES = ("up", "down", "updown", "random", "played")
+_note_bases = itertools.count(1)  # every sequencer plays its own note ids
+
+
+def _note_base():
+    return next(_note_bases) << 16
+
+
+class EventScheduler:
+    """Pending events ordered by the sample they are due at.
+
+    A binary heap, so scheduling and popping stay O(log n) with thousands
+    of events pending, a whole score rendered offline for instance. Only
+    the audio thread touches it; other threads go through
+    ``RenderEngine.post``.
+    """
+
+    def __init__(self):
+        self._heap = []
+        # events due at the same sample keep the order they were scheduled in
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, sample, event, target):
+        """Calls ``target(event, offset)`` in the block holding ``sample``."""
+        heapq.heappush(self._heap, (sample, next(self._order), event, target))
+
+    def pop_due(self, end):
+        """Yields (sample, event, target) for the events due before ``end``,
+        including those scheduled while iterating."""
+        heap = self._heap
+        while heap and heap[0][0] < end:
+            sample, _, event, target = heapq.heappop(heap)
+            yield sample, event, target
+
+    def clear(self):
+        self._heap.clear()
+
+
+class StepSequencer:
+    """Loops a list of MIDI notes, None for a rest, on the sample clock.
+
+    Steps are ``division`` per beat at ``bpm``, each note held for ``gate``
+    of a step. Tempo and gate may change while it runs and apply from the
+    next step. ``start`` is in seconds, None starts on the next block;
+    ``repeats`` stops it after that many passes.
+    """
+
+    def __init__(
+        self,
+        fs,
+        steps,
+        bpm=120.0,
+        division=4,
+        gate=0.5,
+        start: Optional[float] = None,
+        repeats: Optional[int] = None,
+    ):
+        self.fs = fs
+        self.steps = list(steps)
+        self.bpm = bpm
+        self.division = division
+        self.gate = gate
+        self.start = start
+        self.repeats = repeats
+        self.engine = None
+        self.next_step = None  # sample of the next step, fractional
+        self.index = 0  # steps played
+        self.note_base = _note_base()
+
+    def step_length(self):
+        return 60.0 * self.fs / (self.bpm * self.division)
+
+    def duration(self):
+        """Seconds until the last step of the last pass ends, None if endless."""
+        if self.repeats is None:
+            return None
+        steps = self.repeats * len(self.steps)
+        return (self.start or 0.0) + steps * self.step_length() / self.fs
+
+    def attach(self, engine):
+        self.engine = engine
+        if self.start is None:
+            self.next_step = float(engine.clock)
+        else:
+            self.next_step = self.start * self.fs
+
+    def finished(self):
+        return self.repeats is not None and self.index >= self.repeats * len(self.steps)
+
+    def schedule(self, start, end):
+        """Schedules the steps falling between samples ``start`` and ``end``."""
+        engine = self.engine
+        while self.next_step < end and not self.finished():
+            sample = max(round(self.next_step), start)
+            step = self.step_length()
+            note = self.steps[self.index % len(self.steps)]
+            if note is not None:
+                note_id = self.note_base + note
+                length = max(round(self.gate * step), 1)
+                frequency = midi_to_frequency(note)
+                engine.schedule(sample, NoteEvent("on", note_id, frequency))
+                engine.schedule(sample + length, NoteEvent("off", note_id))
+            self.next_step += step
+            self.index += 1
+
+
+class Arpeggiator(StepSequencer):
+    """Plays the held notes one step at a time.
+
+    Notes reach it by posting events with ``arp.input`` as the target, the
+    arpeggiator then decides what sounds. Each step reads the held notes
+    at its own sample, so a chord change lands on the exact step it
+    precedes, live or offline. ``octaves`` repeats the pattern that many
+    octaves up.
+    """
+
+    def __init__(
+        self,
+        fs,
+        mode="up",
+        bpm=120.0,
+        division=4,
+        gate=0.5,
+        octaves=1,
+        start=None,
+        seed=0,
+    ):
+        if mode not in ARP_MODES:
+            raise ValueError(f"Unknown arpeggiator mode {mode!r}")
+        super().__init__(fs, [], bpm, division, gate, start)
+        self.mode = mode
+        self.octaves = octaves
+        self.held = {}  # note -> frequency, in the order they were pressed
+        self.random = random.Random(seed)
+
+    def input(self, event, offset):
+        """Event target taking the notes played into the arpeggiator."""
+        if event.kind == "on":
+            self.held[event.note] = event.value
+        elif event.kind == "off" and event.note in self.held:
+            del self.held[event.note]
+        else:
+            # transposes, and releases of notes pressed before it started
+            if event.kind == "transpose":
+                self.held = {n: f * event.value for n, f in self.held.items()}
+            self.engine.route(event, offset)
+
+    def pattern(self):
+        notes = list(self.held.values())
+        if self.mode != "played":
+            notes.sort()
+        notes = [f * 2**octave for octave in range(self.octaves) for f in notes]
+        if self.mode == "down":
+            notes.reverse()
+        elif self.mode == "updown":
+            notes += notes[-2:0:-1]
+        return notes
+
+    def schedule(self, start, end):
+        # a step only reads the held notes when it is due
+        while self.next_step < end:
+            sample = max(round(self.next_step), start)
+            self.engine.schedule(sample, None, self._step)
+            self.next_step += self.step_length()
+
+    def _step(self, event, offset):
+        pattern = self.pattern()
+        if not pattern:
+            return
+        if self.mode == "random":
+            frequency = self.random.choice(pattern)
+        else:
+            frequency = pattern[self.index % len(pattern)]
+        note_id = self.note_base + self.index % (1 << 16)
+        self.index += 1
+
+        sample = self.engine.clock + offset
+        length = max(round(self.gate * self.step_length()), 1)
+        self.engine.route(NoteEvent("on", note_id, frequency), offset)
+        self.engine.schedule(sample + length, NoteEvent("off", note_id))
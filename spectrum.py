@@ -0,0 +1,137 @@
+import time
+from threading import Event, Thread
+
+import numpy as np
+
+from reverb import load_fft
+
+##################################################
+## Spectrum analyzer: overlapping windowed FFTs of the scope's ring of
+## output samples, on a worker thread, binned into log-spaced bands
+##################################################
+
+FFT_SIZE = 4096
+OVERLAP = 4  # frames per FFT_SIZE samples, a hop of a quarter frame
+BANDS_PER_OCTAVE = 6
+LOWEST_BAND = 20.0  # Hz
+FLOOR_DB = -120.0
+PEAK_HOLD = 1.0  # seconds a peak stays put
+PEAK_FALL = 30.0  # dB per second once it lets go
+
+
+def log_bands(fs, size, per_octave=BANDS_PER_OCTAVE, lowest=LOWEST_BAND):
+    """The first FFT bin of each log-spaced band and each band's centre
+    frequency. Bands narrower than a bin are merged, so none is empty."""
+    df = fs / size
+    n = int(np.log2(fs / 2 / lowest) * per_octave)
+    edges = lowest * 2 ** (np.arange(n + 1) / per_octave)
+    starts = np.unique(np.clip(np.round(edges / df), 1, size // 2).astype(np.intp))
+    ends = np.append(starts[1:], size // 2 + 1)
+    centres = np.sqrt(starts * np.maximum(ends - 1, starts)) * df
+    return starts[:-1], centres[:-1]
+
+
+class SpectrumAnalyzer:
+    """Live spectrum of a ScopeBuffer, in dB per log-spaced band.
+
+    A worker thread wakes up at most ``fps`` times a second, runs a Hann
+    windowed FFT for every hop of new samples (at most as many as the
+    buffer still holds), averages their power and updates the levels and
+    the peak-hold curve. The FFT, window and band sums reuse buffers
+    allocated here, and when nothing was written the thread does no work,
+    so the analyzer can stay on without competing with the audio thread.
+    scipy's FFT is only loaded, on the worker, once there is a frame to
+    analyze. A full-scale sine reads about 0 dB.
+
+    ``levels`` and ``peaks`` are replaced, never modified, after each
+    update, and ``frame`` counts the updates, so the GUI thread can read
+    them without a lock.
+    """
+
+    def __init__(self, scope, fs, size=FFT_SIZE, fps=30.0):
+        self.scope = scope
+        self.fs = fs
+        self.size = size
+        self.hop = size // OVERLAP
+        self.fps = fps
+        self.starts, self.frequencies = log_bands(fs, size)
+
+        self.window = np.hanning(size)
+        # by Parseval, a full-scale sine's power over the bins it leaks into
+        self.scale = 4.0 / (size * np.sum(self.window**2))
+        self.frame_buffer = np.zeros(size)
+        self.spectrum = np.zeros(size // 2 + 1, dtype=np.complex128)
+        self.power = np.zeros(size // 2 + 1)
+        self.total = np.zeros(size // 2 + 1)  # power summed over frames
+        self.bands = np.zeros(len(self.starts))
+        self._rfft = None  # scipy is imported by the first update
+
+        self.levels = np.full(len(self.starts), FLOOR_DB)
+        self.peaks = self.levels
+        self.held = np.zeros(len(self.starts))  # when each peak was set
+        self.updated = 0.0  # perf_counter() of the last update
+        self.frame = 0
+        self.read_index = 0  # scope write index analyzed so far
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _run(self):
+        while not self._stop.wait(1.0 / self.fps):
+            self.update()
+
+    def update(self):
+        """Analyzes the samples written since the last call.
+
+        Returns False when there were too few for a new frame.
+        """
+        scope = self.scope
+        end = scope.write_index
+        available = min(end, scope.capacity) - self.size
+        frames = min((end - self.read_index) // self.hop, available // self.hop + 1)
+        if available < 0 or frames < 1:
+            return False
+        if self._rfft is None:
+            self._rfft, _ = load_fft()
+        # frames end a hop apart, the newest at the newest sample
+        self.total[:] = 0.0
+        for k in range(frames):
+            samples = scope.window(end - k * self.hop, self.size)
+            np.multiply(samples, self.window, out=self.frame_buffer)
+            self._rfft(self.frame_buffer, self.spectrum)
+            np.multiply(self.spectrum.real, self.spectrum.real, out=self.power)
+            self.total += self.power
+            np.multiply(self.spectrum.imag, self.spectrum.imag, out=self.power)
+            self.total += self.power
+        self.read_index = end
+
+        self.total *= self.scale / frames
+        np.add.reduceat(self.total, self.starts, out=self.bands)
+        np.maximum(self.bands, 10 ** (FLOOR_DB / 10), out=self.bands)
+        levels = 10 * np.log10(self.bands)
+
+        now = time.perf_counter()
+        fall = PEAK_FALL * min(now - self.updated, 1.0)
+        peaks = np.where(now - self.held > PEAK_HOLD, self.peaks - fall, self.peaks)
+        rising = levels >= peaks
+        self.held[rising] = now
+        self.peaks = np.maximum(peaks, levels)
+        self.levels = levels
+        self.updated = now
+        self.frame += 1
+        return True
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from wavetable import CACHE_DIR
+
+##################################################
+## Startup helpers: milestone timing from launch and a disk cache for
+## the state the window needs before it can show anything
+##################################################
+
+STATE_VERSION = 1
+
+
+class StartupTimer:
+    """Milestones in milliseconds since the process started.
+
+    The launch time is estimated from the CPU time used when the timer is
+    created, which is close while start-up is busy importing modules.
+    """
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter() - time.process_time()
+        self.marks = {}
+
+    def mark(self, name: str) -> None:
+        self.marks[name] = (time.perf_counter() - self.origin) * 1000
+
+    def report(self) -> str:
+        marks = sorted(self.marks.items(), key=lambda mark: mark[1])
+        return "startup: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in marks)
+
+
+def cached_state(name, key, build):
+    """Returns the dict of arrays ``build()`` makes, cached on disk by ``key``.
+
+    ``key`` is any value with a stable repr; a different key (new settings,
+    sample rate or STATE_VERSION) builds and stores a fresh copy.
+    """
+    digest = hashlib.sha1(repr((STATE_VERSION, key)).encode()).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f"{name}_{digest}.npz")
+    try:
+        with np.load(path) as cached:
+            return dict(cached)
+    except (OSError, ValueError):
+        pass
+
+    state = build()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **state)
+        os.replace(tmp, path)
+    except OSError:
+        print(f"Warning: could not write the {name} cache.")
+    return state
@@ -1,24 +1,45 @@
+import argparse
 import sys
 import time
-from queue import Queue
 from threading import Thread
 
 import numpy as np
-import pyqtgraph as pg
-from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import (
     QApplication,
+    QButtonGroup,
     QCheckBox,
+    QComboBox,
     QErrorMessage,
+    QLabel,
     QMainWindow,
     QPushButton,
     QRadioButton,
 )
-from scipy import signal
-from scipy.signal import butter, cheby1, lfilter
 
+from drive import OVERSAMPLING
+from engine import (
+    BLOCK_SIZES,
+    SAMPLE_RATE,
+    SAMPLE_RATES,
+    VOICES,
+    RenderEngine,
+    make_params,
+)
+from filters import FilterDesignCache
 from gui import GUI
-from real_time_audio import run_synth
+from inputs import ComputerKeyboard, KeyboardHookSource, MidiSource
+from modulation import SHAPES, TARGETS
+from notecache import NOTE_CACHE_BYTES, NoteCache
+from patches import Patch, PresetBank, adsr_preview
+from plotting import Curve, FrameScheduler
+from real_time_audio import BLOCK_SIZE, run_synth
+from render_pool import VoicePool
+from reverb import load_impulse
+from scope import ScopeBuffer
+from sequencer import ARP_MODES, Arpeggiator
+from spectrum import SpectrumAnalyzer
+from startup import StartupTimer, cached_state
 
 ##################################################
 ## A real time-based synthetizer made with pyaudio and pyqt5
@@ -31,67 +52,135 @@ from real_time_audio import run_synth
 ##################################################
 
 VERSION = "0.1.3"
-SAMPLE_RATE = 44100
+SCOPE_SAMPLES = 2048  # samples shown on the waveform graph
+PERF_WIDTH = 340  # panel right of the controls for the profiler report
 
 
-class SignalCommunicate(QObject):
-    request_filter_update = pyqtSignal(np.ndarray, np.ndarray)
-    request_ADSR_update = pyqtSignal(np.ndarray, np.ndarray)
-    request_signal_update = pyqtSignal(np.ndarray, np.ndarray)
+def _no_focus(*widgets):
+    """Keeps ``widgets`` out of the keyboard focus, so keys typed into the
+    window play notes instead of feeding a menu's type-ahead."""
+    for widget in widgets:
+        widget.setFocusPolicy(Qt.NoFocus)
 
 
 class Synthesizer(QMainWindow):
-    def __init__(self):
+    def __init__(
+        self,
+        n_voices=VOICES,
+        voice_workers=0,
+        profile=False,
+        trace=None,
+        fs=SAMPLE_RATE,
+        block_size=BLOCK_SIZE,
+        low_latency=False,
+        samples=None,
+        float32=False,
+        impulse="",
+        note_cache=0,
+    ):
         super().__init__()
+        self.startup = StartupTimer()
+        self.startup.mark("imports")
 
-        self.started = False
+        self.started = False  # plots built
         self.wave = "sinusoidal"
-        self.fs = SAMPLE_RATE
-        self.t = np.linspace(0, 1, self.fs)  # Used for plotting ADSR envelope
+        self.fs = fs
+        # audio block, the smallest that works with low_latency
+        self.block_size = block_size
+        self.low_latency = low_latency
         self.ftype = "low"  # Default filter type
         self.forder = 2
+        self.modulation = ()  # a preset's LFOs beyond the one on the GUI
+        self.impulse = impulse  # the reverb's impulse response, "" for the built-in
 
         p = self.palette()
         p.setColor(self.backgroundRole(), Qt.black)
         self.setPalette(p)
 
         # --- ADSR Parameters ---
-        self.a_knob = 11025
-        self.d_knob = 11025
-        self.s_knob = 5000
-        self.r_knob = 11025
-        self.adsr_envelope = np.zeros(self.fs)
+        # times in milliseconds, sustain in percent
+        self.a_knob = 250
+        self.d_knob = 250
+        self.s_knob = 45
+        self.r_knob = 500
+        self.adsr_envelope = np.zeros(self.fs)  # preview curve for the plot
 
         # --- Filter Parameters ---
-        self.filter_state = np.zeros(self.forder)
-        self.filter_b = np.array([1.0])
-        self.filter_a = np.array([1.0])
+        self.filter_sos = np.array([[1.0, 0.0, 0.0, 1.0, 0.0, 0.0]])
+        self.filter_response = (np.ones(1), np.zeros(1))
+        self.filter_cache = FilterDesignCache(self.fs)
+        self.presets = PresetBank.load(self.fs, filter_cache=self.filter_cache)
 
-        # --- Inter-thread communication ---
-        self.waveform_queue = Queue()
+        # --- Audio engine and inter-thread communication ---
+        try:
+            self.engine = RenderEngine(self.fs, n_voices, samples, float32)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load the samples in {samples}: {e}")
+            samples = None
+            self.engine = RenderEngine(self.fs, n_voices, float32=float32)
+        if note_cache:
+            # rebuilt by run_synth if the audio settles on another block size
+            self.engine.set_note_cache(
+                NoteCache(self.block_size, self.engine.dtype, note_cache)
+            )
+        self.engine.filter_wait = False  # the audio thread never waits for scipy
+        if self.engine.sampler is not None:
+            self.engine.sampler.wait = False  # nor for the disk
+        if impulse:
+            try:
+                load_impulse(impulse, self.fs)
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not load the impulse response {impulse}: {e}")
+                self.impulse = ""
+        self.scope = ScopeBuffer()
+        self.engine.scope = self.scope
+        self.analyzer = SpectrumAnalyzer(self.scope, self.fs)
+        self.spectrum_drawn = 0  # analyzer frame at the last redraw
+        if voice_workers:
+            self.engine.attach_pool(
+                VoicePool(self.fs, n_voices, voice_workers, samples=samples)
+            )
+        self.engine.profiler.enabled = profile or trace is not None
+        self.trace_path = trace
+        self.scope_drawn = 0  # scope write index at the last redraw
+        self.ui_ready = False
 
+        # audio first, the device opens while the window is built
         self.t1 = None
+        self.init_synth()
 
+        # --- Note input, every source posts events to the engine ---
+        self.arp = Arpeggiator(self.fs)  # plays the held notes while "Arp" is on
+        self.arp_on = False
+        self.keys = ComputerKeyboard(self.post_note, on_quit=self.stop_audio)
+        self.sources = []
+
+        self.frames = FrameScheduler(self)
         self.gui = GUI(self)
         self._setup_ui()
 
-        self.signal_comm = SignalCommunicate()
-        self.signal_comm.request_signal_update.connect(self.update_signal_graph)
-        self.signal_comm.request_ADSR_update.connect(self.update_ADSR_graph)
-        self.signal_comm.request_filter_update.connect(self.update_filter_graph)
-
         # init GUI
-        self.setGeometry(50, 50, 1100, 600)
+        width = 1100 + (PERF_WIDTH if self.engine.profiler.enabled else 0)
+        self.setGeometry(50, 50, width, 600)
         self.setWindowTitle("Synthesizer")
+        self.set_counter()
         self.show()
+        self.startup.mark("window")
+        self.start_inputs()
 
-        self.init_synth()
+        # pyqtgraph is slow to import, the plots come once the window is up
+        QTimer.singleShot(0, self._build_plots)
 
         # Timer to update the waveform graph without blocking the audio thread
-        self.graph_update_timer = pg.QtCore.QTimer()
+        self.graph_update_timer = QTimer()
         self.graph_update_timer.timeout.connect(self.update_waveform_graph)
         self.graph_update_timer.start(33)  # Update roughly 30 times per second
 
+        if self.engine.profiler.enabled:
+            self.perf_timer = QTimer()
+            self.perf_timer.timeout.connect(self.update_perf_overlay)
+            self.perf_timer.start(500)
+
     def _setup_ui(self):
         """Create and arrange all GUI widgets."""
         # Filter Type Radio Buttons
@@ -101,23 +190,28 @@ class Synthesizer(QMainWindow):
             "Bandpass": (300, 500),
             "Bandstop": (300, 540),
         }
+        # separate groups, otherwise all radio buttons of the window exclude each other
+        self.filter_group = QButtonGroup(self)
+        self.filter_radio_buttons = []
         for name, pos in filter_radios.items():
             rb = QRadioButton(name, self)
             rb.name = name.lower()
             rb.toggled.connect(self.onClickedF)
             rb.setStyleSheet("color: white;")
             rb.setGeometry(pos[0], pos[1], 100, 32)
+            self.filter_group.addButton(rb)
+            self.filter_radio_buttons.append(rb)
 
-        # Plot Widgets
-        self.graphWidget1 = pg.PlotWidget(self)  # ADSR
-        self.graphWidget1.setGeometry(300, 20, 300, 150)
+        self.scope_trigger = QCheckBox("Trigger", self)
+        self.scope_trigger.setChecked(True)
+        self.scope_trigger.setStyleSheet("color: white;")
+        self.scope_trigger.setGeometry(880, 170, 80, 20)
 
-        self.graphWidget2 = pg.PlotWidget(self)  # Waveform
-        self.graphWidget2.setGeometry(650, 20, 300, 150)
-        self.graphWidget2.setYRange(-1, 1)
-
-        self.graphWidget3 = pg.PlotWidget(self)  # Filter response
-        self.graphWidget3.setGeometry(650, 190, 300, 150)
+        self.spectrum_box = QCheckBox("Spectrum", self)
+        self.spectrum_box.setChecked(True)
+        self.spectrum_box.setStyleSheet("color: white;")
+        self.spectrum_box.setGeometry(870, 340, 90, 20)
+        self.spectrum_box.toggled.connect(self.toggle_spectrum)
 
         # Waveform Type Radio Buttons
         wave_radios = {
@@ -126,7 +220,9 @@ class Synthesizer(QMainWindow):
             "Sawtooth": ("sawtooth", (1000, 160)),
             "Square": ("square", (1000, 220)),
             "Noise": ("noise", (1000, 280)),
+            "Sample": ("sample", (1000, 340)),
         }
+        self.wave_group = QButtonGroup(self)
         self.wave_radio_buttons = []
         for name, (wave_type, pos) in wave_radios.items():
             rb = QRadioButton(name, self)
@@ -134,6 +230,8 @@ class Synthesizer(QMainWindow):
             rb.toggled.connect(self.onClicked)
             rb.setStyleSheet("color: white;")
             rb.setGeometry(pos[0], pos[1], 200, 30)
+            rb.setEnabled(wave_type != "sample" or self.engine.sampler is not None)
+            self.wave_group.addButton(rb)
             self.wave_radio_buttons.append(rb)
         self.wave_radio_buttons[0].setChecked(True)
 
@@ -142,161 +240,204 @@ class Synthesizer(QMainWindow):
         self.lfo.toggled.connect(self.active_lfo)
         self.lfo.setStyleSheet("color: white;")
         self.lfo.setGeometry(40, 280, 100, 32)
+        self.lfo_shape_box = QComboBox(self)
+        self.lfo_shape_box.addItems(SHAPES)
+        self.lfo_shape_box.setGeometry(90, 283, 70, 26)
+        _no_focus(self.lfo_shape_box)
+        self.lfo_shape_box.activated.connect(self.publish_params)
+        self.lfo_target_box = QComboBox(self)
+        self.lfo_target_box.addItems(TARGETS)
+        self.lfo_target_box.setGeometry(165, 283, 75, 26)
+        _no_focus(self.lfo_target_box)
+        self.lfo_target_box.activated.connect(self.publish_params)
 
         self.lowpass_check = QCheckBox("Filter", self)
+        self.lowpass_check.toggled.connect(self.publish_params)
         self.lowpass_check.setStyleSheet("color: white;")
         self.lowpass_check.setGeometry(300, 190, 100, 32)
 
         self.delay_box = QCheckBox("Delay", self)
-        # self.delay_box.toggled.connect(self.set_delay) # This is not needed
+        self.delay_box.toggled.connect(self.publish_params)
         self.delay_box.setStyleSheet("color: white;")
         self.delay_box.setGeometry(40, 490, 100, 32)
 
+        self.reverb_box = QCheckBox("Reverb", self)
+        self.reverb_box.toggled.connect(self.publish_params)
+        self.reverb_box.setStyleSheet("color: white;")
+        self.reverb_box.setGeometry(140, 490, 100, 32)
+
+        self.drive_box = QCheckBox("Drive", self)
+        self.drive_box.toggled.connect(self.publish_params)
+        self.drive_box.setStyleSheet("color: white;")
+        self.drive_box.setGeometry(870, 385, 65, 26)
+        self.drive_quality_box = QComboBox(self)
+        self.drive_quality_box.addItems([f"{n}x" for n in OVERSAMPLING])
+        self.drive_quality_box.setCurrentText("4x")
+        self.drive_quality_box.setGeometry(940, 385, 55, 26)
+        _no_focus(self.drive_quality_box)
+        self.drive_quality_box.activated.connect(self.publish_params)
+
+        # Arpeggiator
+        self.arp_box = QCheckBox("Arp", self)
+        self.arp_box.toggled.connect(self.toggle_arp)
+        self.arp_box.setStyleSheet("color: white;")
+        self.arp_box.setGeometry(650, 505, 55, 26)
+        self.arp_mode_box = QComboBox(self)
+        self.arp_mode_box.addItems(ARP_MODES)
+        self.arp_mode_box.setGeometry(710, 505, 80, 26)
+        _no_focus(self.arp_mode_box)
+        self.arp_mode_box.activated[str].connect(self.set_arp_mode)
+
+        # Presets
+        self.preset_box = QComboBox(self)
+        self.preset_box.addItems(self.presets.names())
+        self.preset_box.setGeometry(300, 440, 140, 28)
+        _no_focus(self.preset_box)
+        self.preset_box.activated[str].connect(self.select_preset)
+        self.save_preset_button = QPushButton("Save", self)
+        self.save_preset_button.setGeometry(445, 440, 55, 28)
+        self.save_preset_button.clicked.connect(self.save_preset)
+
+        # Performance report, in a panel the window widens by when profiling
+        self.perf_label = QLabel(self)
+        self.perf_label.setStyleSheet(
+            "color: white; font-family: monospace; font-size: 11px;"
+        )
+        self.perf_label.setGeometry(1100, 20, PERF_WIDTH - 10, 560)
+        self.perf_label.setAlignment(Qt.AlignTop)
+        self.perf_label.setVisible(self.engine.profiler.enabled)
+
         # Initial state setup
         self.update_adsr_envelope()
-        self.set_filter(init=True)
+        self.load_initial_filter()
+        self.ui_ready = True
+        self.publish_params()
 
-    def set_filter(self, init=False):
-        """Calculates and plots the filter frequency response."""
-        if init:
-            # Initial filter plot setup
-            order = 2
-            nyq = 0.5 * self.fs
-            normal_cutoff = 100 / nyq
-            b, a = cheby1(order, 12, normal_cutoff, btype="low", analog=True)
-            w, h = signal.freqs(b, a)
-            h *= 2
-            self.data_filter = self.graphWidget3.plot(w * 22050, 20 * np.log10(abs(h)))
-            self.graphWidget3.setLogMode(True, False)
-            self.graphWidget3.setXRange(1, 5)
-            self.graphWidget3.setYRange(-20, 10)
-        else:
-            # Update filter plot and coefficients
-            b, a = self.calculate_filter_coeffs(analog=True)
-            w, h = signal.freqs(b, a)
-            if self.ftype not in ["bandpass", "bandstop"]:
-                h *= 2
-            y = 20 * np.log10(abs(h))
-            self.signal_comm.request_filter_update.emit(w * 22050, y)
+    def _build_plots(self):
+        """Creates the plot widgets, deferred until the window is showing."""
+        import pyqtgraph as pg
 
-        # Cache digital filter coefficients for the audio thread
-        self.filter_b, self.filter_a = self.calculate_filter_coeffs(analog=False)
+        self.graphWidget1 = pg.PlotWidget(self)  # ADSR
+        self.graphWidget1.setGeometry(300, 20, 300, 150)
+        self.adsr_curve = Curve(self.graphWidget1, self.frames, dx=1 / self.fs)
+        self.adsr_curve.set_data(self.adsr_envelope)
 
-    def update_signal_graph(self, x, y):
-        self.signal_line.setData(x, y)
+        self.graphWidget2 = pg.PlotWidget(self)  # Waveform
+        self.graphWidget2.setGeometry(650, 20, 300, 150)
+        self.graphWidget2.setYRange(-1, 1)
+        self.scope_curve = Curve(self.graphWidget2, self.frames, dx=1 / self.fs)
+        self.scope_curve.set_data(np.zeros(SCOPE_SAMPLES))
 
-    def update_ADSR_graph(self, x, y):
-        self.data_line.setData(x, y)
+        self.graphWidget3 = pg.PlotWidget(self)  # Filter response and spectrum
+        self.graphWidget3.setGeometry(650, 190, 300, 150)
+        self.peak_curve = Curve(self.graphWidget3, self.frames, pen=(120, 90, 0))
+        self.spectrum_curve = Curve(self.graphWidget3, self.frames, pen=(0, 170, 255))
+        self.filter_curve = Curve(self.graphWidget3, self.frames)
+        self.filter_curve.set_data(self.filter_response[1], self.filter_response[0])
+        self.graphWidget3.setLogMode(True, False)
+        self.graphWidget3.setXRange(1, 5)
+        self.show_spectrum(self.spectrum_box.isChecked())
+
+        for widget in (self.graphWidget1, self.graphWidget2, self.graphWidget3):
+            widget.show()
+        self.started = True
+        self.startup.mark("plots")
+        print(self.startup.report())
+
+        # loads scipy and fills the filter cache in the background
+        self.warm_filter_cache()
+        self.presets.warm()
+        if self.engine.sampler is not None:
+            self.engine.sampler.warm()
+        self.warm_reverb()
+        if self.spectrum_box.isChecked():
+            self.analyzer.start()
+
+    def warm_reverb(self):
+        """Computes the impulse response spectra before the Reverb box is checked."""
+        impulse, block, dtype = self.impulse, self.block_size, self.engine.dtype
+        Thread(
+            target=lambda: load_impulse(impulse, self.fs).spectra(block, dtype),
+            daemon=True,
+        ).start()
+
+    def load_initial_filter(self):
+        """The filter at the startup settings, from disk so scipy can wait."""
+        cutoff, bandwidth = self.mySlider6.value(), self.mySliderQ.value()
+
+        def build():
+            sos, (x, y) = self.filter_cache.get(
+                self.ftype, self.forder, cutoff, bandwidth
+            )
+            return {"sos": sos, "x": x, "y": y}
 
-    def update_filter_graph(self, x, y):
-        self.data_filter.setData(x, y)
+        key = (self.fs, self.ftype, self.forder, cutoff, bandwidth)
+        state = cached_state("initial_filter", key, build)
+        self.filter_sos = state["sos"]
+        self.filter_response = (state["x"], state["y"])
 
-    def set_order(self):
-        self.forder = self.mySlider7.value()
-        self.filter_state = np.zeros(self.forder)
-        if self.ftype in ["bandpass", "bandstop"]:
-            self.filter_state = np.zeros(self.forder * 2)
-        self.set_filter()
+    def set_filter(self):
+        """Calculates and plots the filter frequency response."""
+        # Digital coefficients for the audio thread and the plotted response
+        self.filter_sos, self.filter_response = self.filter_cache.get(
+            self.ftype, self.forder, self.mySlider6.value(), self.mySliderQ.value()
+        )
+        if self.started:
+            self.filter_curve.set_data(self.filter_response[1], self.filter_response[0])
+        self.publish_params()
 
-    def calculate_filter_coeffs(self, analog=False):
-        normal_cutoff = self.mySlider6.value()
-        nyq = 0.5 * self.fs  # max freq
-        normal_cutoff = normal_cutoff / nyq  # real cut freq
-        if self.ftype in ["bandpass", "bandstop"]:
-            b, a = butter(
-                self.forder,
-                [  # This calculation for band edges might need review
-                    (normal_cutoff - self.mySliderQ.value() * 0.5 / nyq),
-                    (normal_cutoff + self.mySliderQ.value() * 0.5 / nyq),
-                ],
-                btype=self.ftype,
-                analog=analog,
-            )  # generacion de numerador y denominador del modelo matematico del filtro
-        else:
-            b, a = cheby1(
-                self.forder, 12, normal_cutoff, btype=self.ftype, analog=analog
-            )
-        return b, a
+    def request_filter(self):
+        """Redesigns the filter once per frame however fast the sliders move."""
+        self.frames.request("filter", self.set_filter)
 
-    def apply_filter(self, sig):
-        # Use cached filter coefficients
-        try:
-            r, self.filter_state = lfilter(
-                self.filter_b, self.filter_a, sig, axis=0, zi=self.filter_state
-            )
-        except ValueError:
-            # This can happen if filter state is not the correct size.
-            # This is a failsafe to reset it and continue.
-            print("Warning: Mismatch in filter state size. Resetting filter state.")
-            # The expected size for zi is max(len(a), len(b)) - 1
-            expected_len = max(len(self.filter_a), len(self.filter_b)) - 1
-            self.filter_state = np.zeros(expected_len)
-            # Retry lfilter with the corrected state
-            r, self.filter_state = lfilter(
-                self.filter_b, self.filter_a, sig, axis=0, zi=self.filter_state
-            )
-        if self.ftype not in ["bandpass", "bandstop"]:
-            r *= 2
-        return r
+    def warm_filter_cache(self):
+        """Precomputes the designs a cutoff drag will need at the current settings."""
+        self.filter_cache.warm(self.ftype, self.forder, self.mySliderQ.value())
+
+    def set_order(self):
+        self.forder = self.mySlider7.value()
+        self.request_filter()
+        self.warm_filter_cache()
 
     def onClickedF(self):
         # radiobutton control
         radioButton = self.sender()
         if radioButton.isChecked():
             self.ftype = radioButton.name
-        self.filter_state = np.zeros(self.forder)
-        if radioButton.name in ["bandpass", "bandstop"]:
-            self.filter_state = np.zeros(self.forder * 2)
 
         self.set_filter()
+        self.warm_filter_cache()
 
     def onClicked(self):
         # radiobutton control
         radioButton = self.sender()
         if radioButton.isChecked():
             self.wave = radioButton.wave
+            self.publish_params()
 
     def active_lfo(self):
         # slider control
         message = f"LFO: {self.mySlider4.value()}Hz"
         self.myLabel4.setText(message)
+        self.publish_params()
 
     def update_adsr_envelope(self):
-        """Calculates the ADSR envelope and updates the plot and cached envelope."""
-        a_len, d_len, s_val, r_len = self.a_knob, self.d_knob, self.s_knob, self.r_knob
-
-        if a_len + d_len + r_len >= self.fs:
-            # Handle case where ADSR times are too long for the buffer
-            # For now, just return to avoid crashing. A real implementation might scale them.
-            print("Warning: ADSR times exceed sample rate.")
-            return
-
-        a = (np.logspace(1, 0, a_len) / 10) * -1 + 1.1
-        d = np.logspace(1, s_val / 11025, d_len) / 10
-        r = np.logspace(s_val / 11025, 0, r_len) / 10
-        s_len = self.fs - a_len - d_len - r_len
-        s = np.ones(s_len) * 10 ** (s_val / 11025) / 10
+        """Recomputes and plots the envelope preview."""
+        self.adsr_envelope = adsr_preview(
+            self.fs, self.a_knob, self.d_knob, self.s_knob, self.r_knob
+        )
+        if self.started:
+            self.adsr_curve.set_data(self.adsr_envelope)
 
-        self.adsr_envelope = np.concatenate((a, d, s, r)) * 1.1 - 0.1
-        self.adsr_envelope *= 0.707  # Apply gain
-
-        # Update graphs
-        if not self.started:
-            self.data_line = self.graphWidget1.plot(self.t, self.adsr_envelope)
-            self.signal_line = self.graphWidget2.plot(
-                np.linspace(0, 2048 / self.fs, 2048), np.zeros(2048)
-            )
-            self.started = True
-        else:
-            self.signal_comm.request_ADSR_update.emit(self.t, self.adsr_envelope)
+    @staticmethod
+    def knob_label(name, value):
+        units = "%" if name == "Sustain" else "ms"
+        return f"{name}: {value}{units}"
 
     def change_knob(self, value):
         # sliders que controlan valores de la senal envolvente
         knob = self.sender()
-        units = "" if knob.name == "Sustain" else "ms"
-        v = str(value / 44.1)[:3]
-        v = str(value * 2 / 44.1)[:3] if knob.name == "Release" else v
-        message = f"{knob.name}: {v}{units}"
+        message = self.knob_label(knob.name, value)
         if knob.name == "Attack":
             self.a_knob = value
             self.mySlider2.setValue(self.d_knob)
@@ -312,88 +453,201 @@ class Synthesizer(QMainWindow):
             self.r_knob = value
             self.myLabelR.setText(message)
 
-        self.update_adsr_envelope()
+        # the audio thread gets the new value now, the plot once per frame
+        self.publish_params()
+        self.frames.request("adsr", self.update_adsr_envelope)
 
-    def get_waveform(self, frequency, t):
-        if self.wave == "sinusoidal":
-            armed_signal = np.sin(frequency * t * 2 * np.pi)
-        elif self.wave == "triangle":
-            armed_signal = 0.707 * signal.sawtooth(frequency * t * 2 * np.pi, 0.5)
-        elif self.wave == "sawtooth":
-            armed_signal = 0.5 * signal.sawtooth(frequency * t * 2 * np.pi, 1)
-        elif self.wave == "square":
-            armed_signal = 0.5 * signal.square(frequency * t * 2 * np.pi)
-        elif self.wave == "noise":
-            armed_signal = 0.707 * (np.random.rand(2048) * 2) - 1
-        return armed_signal
-
-    def waveform(self, frequency, played_chunk, release_chunk, chunk, feedback=3):
-        # waveform control based on GUI settings
-        t = np.linspace(
-            (played_chunk * chunk) / self.fs,
-            ((played_chunk + 1) * chunk) / self.fs,
-            chunk,
-            endpoint=False,
-        )
-        armed_signal = self.get_waveform(frequency, t)
-
-        if self.lfo.isChecked():
-            lfo_a = self.mySlider5A.value() / 200
-            lfo_off = self.mySlider5.value() / 200
-            LFO = lfo_a * (np.sin(self.mySlider4.value() * t * 2 * np.pi))
-            armed_signal = armed_signal * (LFO + lfo_off)
-
-        if played_chunk < 1 + (self.a_knob + self.d_knob) // chunk:
-            armed_signal *= self.adsr_envelope[
-                (played_chunk * chunk) : ((played_chunk + 1) * chunk)
-            ]
+    def toggle_spectrum(self, on):
+        if on:
+            self.analyzer.start()
         else:
-            if release_chunk > 0:
-                release = (
-                    0.707 * np.logspace(synth.s_knob / 11025, 0, synth.r_knob * 2) / 10
-                )
-                release = np.concatenate((release, np.zeros(synth.fs)))
-                armed_signal *= release[
-                    release_chunk * chunk : (release_chunk + 1) * chunk
-                ]
-            else:
-                armed_signal *= (
-                    0.707 * np.ones(chunk) * 10 ** (self.s_knob / 11025) / 10
-                )
-
-        if self.lowpass_check.isChecked() and frequency != 15:
-            armed_signal = self.apply_filter(armed_signal)
-
-        # checkbox effects
-
-        # NOTE: Recursive delay is very inefficient. A delay buffer (ring buffer)
-        # would be a much better approach for performance.
-        if self.delay_box.isChecked() and feedback > 0:
-            delay_chunks = self.mySlider8.value() // chunk  # + 1
-            if played_chunk >= delay_chunks:
-                delayed_signal = self.waveform(
-                    frequency,
-                    played_chunk - delay_chunks,
-                    release_chunk - delay_chunks,
-                    chunk,
-                    feedback - 1,
-                )
-                armed_signal = armed_signal + delayed_signal * 0.5
-
-        # Only put the final signal in the queue for plotting (not the recursive delay calls)
-        if feedback == 3:
-            if not self.waveform_queue.full():
-                self.waveform_queue.put(armed_signal)
-
-        return armed_signal
+            self.analyzer.stop()
+        if self.started:
+            self.show_spectrum(on)
+
+    def show_spectrum(self, on):
+        """Shows the spectrum over the filter response, or the response alone."""
+        for curve in (self.spectrum_curve, self.peak_curve):
+            curve.item.setVisible(on)
+        self.graphWidget3.setYRange(-90 if on else -20, 10)
 
     def update_waveform_graph(self):
-        """Reads from the queue and updates the graph in the main GUI thread."""
-        if not self.waveform_queue.empty():
-            data = self.waveform_queue.get()
-            self.update_signal_graph(
-                np.linspace(0, len(data) / self.fs, len(data)), data
-            )
+        """Redraws the scope from the ring buffer and the spectrum from the
+        analyzer in the main GUI thread, and closes a voice pool the audio
+        thread dropped."""
+        pool = self.engine.take_dropped_pool()
+        if pool is not None:
+            print("voice pool missed its deadline, rendering in-thread")
+            Thread(target=pool.close, daemon=True).start()
+        analyzer = self.analyzer
+        if self.started and analyzer.running and analyzer.frame != self.spectrum_drawn:
+            self.spectrum_drawn = analyzer.frame
+            self.spectrum_curve.set_data(analyzer.levels, analyzer.frequencies)
+            self.peak_curve.set_data(analyzer.peaks, analyzer.frequencies)
+        if not self.started or self.scope.write_index == self.scope_drawn:
+            return  # nothing new since the last frame
+        self.scope_drawn = self.scope.write_index
+        if self.scope_trigger.isChecked():
+            self.scope_curve.set_data(self.scope.triggered(SCOPE_SAMPLES))
+        else:
+            self.scope_curve.set_data(self.scope.latest(SCOPE_SAMPLES))
+
+    def publish_params(self):
+        """Publishes a fresh parameter snapshot for the audio thread."""
+        if not self.ui_ready:
+            return
+        self.engine.params = make_params(
+            self.fs, filter_sos=self.filter_sos, **self.current_patch().settings()
+        )
+        self.engine.warm_filter(self.engine.params)
+
+    def current_patch(self, name="Init"):
+        """The settings of every control as a Patch."""
+        return Patch(
+            name,
+            wave=self.wave,
+            attack=self.a_knob,
+            decay=self.d_knob,
+            sustain=self.s_knob,
+            release=self.r_knob,
+            lfo=self.lfo.isChecked(),
+            lfo_rate=self.mySlider4.value(),
+            lfo_amplitude=self.mySlider5A.value(),
+            lfo_offset=self.mySlider5.value(),
+            lfo_shape=self.lfo_shape_box.currentText(),
+            lfo_target=self.lfo_target_box.currentText(),
+            modulation=self.modulation,
+            filter=self.lowpass_check.isChecked(),
+            ftype=self.ftype,
+            order=self.forder,
+            cutoff=self.mySlider6.value(),
+            bandwidth=self.mySliderQ.value(),
+            drive=self.drive_box.isChecked(),
+            drive_gain=self.mySliderDrive.value(),
+            drive_oversampling=int(self.drive_quality_box.currentText()[:-1]),
+            delay=self.delay_box.isChecked(),
+            delay_time=self.mySlider8.value(),
+            delay_feedback=self.mySliderFb.value(),
+            delay_mix=self.mySliderMix.value(),
+            reverb=self.reverb_box.isChecked(),
+            reverb_mix=self.mySliderReverb.value(),
+            reverb_ir=self.impulse,
+        )
+
+    def select_preset(self, name):
+        self.apply_patch(self.presets[name])
+
+    def save_preset(self):
+        """Stores the current settings as a new preset in the user bank."""
+        names = self.presets.names()
+        n = 1
+        while f"User {n}" in names:
+            n += 1
+        patch = self.current_patch(f"User {n}")
+        self.presets.add(patch)
+        try:
+            self.presets.save()
+        except OSError as e:
+            print(f"Warning: could not save the presets: {e}")
+        self.preset_box.addItem(patch.name)
+        self.preset_box.setCurrentText(patch.name)
+
+    def apply_patch(self, prepared):
+        """Switches to a prepared patch in one engine update.
+
+        The controls are moved with their signals blocked, so nothing is
+        recomputed or published once per control.
+        """
+        self.engine.params = prepared.params
+        self.engine.warm_filter(prepared.params)
+        patch = prepared.patch
+
+        controls = {
+            self.mySlider1: patch.attack,
+            self.mySlider2: patch.decay,
+            self.mySlider3: patch.sustain,
+            self.mySliderR: patch.release,
+            self.mySlider4: patch.lfo_rate,
+            self.mySlider5: patch.lfo_offset,
+            self.mySlider5A: patch.lfo_amplitude,
+            self.mySlider6: patch.cutoff,
+            self.mySliderQ: patch.bandwidth,
+            self.mySliderDrive: patch.drive_gain,
+            self.mySlider7: patch.order,
+            self.mySlider8: patch.delay_time,
+            self.mySliderFb: patch.delay_feedback,
+            self.mySliderMix: patch.delay_mix,
+            self.mySliderReverb: patch.reverb_mix,
+        }
+        checks = {
+            self.lfo: patch.lfo,
+            self.lowpass_check: patch.filter,
+            self.drive_box: patch.drive,
+            self.delay_box: patch.delay,
+            self.reverb_box: patch.reverb,
+        }
+        choices = {
+            self.lfo_shape_box: patch.lfo_shape,
+            self.lfo_target_box: patch.lfo_target,
+            self.drive_quality_box: f"{patch.drive_oversampling}x",
+        }
+        radios = self.wave_radio_buttons + self.filter_radio_buttons
+        widgets = [*controls, *checks, *choices, *radios]
+        for widget in widgets:
+            widget.blockSignals(True)
+        try:
+            for slider, value in controls.items():
+                slider.setValue(value)
+            for box, checked in checks.items():
+                box.setChecked(checked)
+            for box, text in choices.items():
+                box.setCurrentText(text)
+            for rb in self.wave_radio_buttons:
+                rb.setChecked(rb.wave == patch.wave)
+            for rb in self.filter_radio_buttons:
+                rb.setChecked(rb.name in (patch.ftype, patch.ftype + "pass"))
+        finally:
+            for widget in widgets:
+                widget.blockSignals(False)
+
+        self.wave = patch.wave
+        self.a_knob, self.d_knob = patch.attack, patch.decay
+        self.s_knob, self.r_knob = patch.sustain, patch.release
+        self.ftype, self.forder = patch.ftype, patch.order
+        self.modulation = patch.modulation
+        self.impulse = patch.reverb_ir
+        self.filter_sos = prepared.params.filter_sos
+        self.filter_response = prepared.filter_response
+        self.adsr_envelope = prepared.envelope
+
+        self.myLabel1.setText(self.knob_label("Attack", patch.attack))
+        self.myLabel2.setText(self.knob_label("Decay", patch.decay))
+        self.myLabel3.setText(self.knob_label("Sustain", patch.sustain))
+        self.myLabelR.setText(self.knob_label("Release", patch.release))
+        self.myLabel4.setText(f"LFO: {patch.lfo_rate}Hz")
+        if self.started:
+            self.adsr_curve.set_data(self.adsr_envelope)
+            self.filter_curve.set_data(self.filter_response[1], self.filter_response[0])
+        self.warm_filter_cache()
+
+    def post_note(self, event):
+        """Sends note input to the arpeggiator while it is on, else to the voices."""
+        self.engine.post(event, self.arp.input if self.arp_on else None)
+
+    def toggle_arp(self, on):
+        self.arp_on = on
+        if on:
+            self.engine.add_sequencer(self.arp)
+        else:
+            self.engine.remove_sequencer(self.arp)
+            self.arp.held = {}
+
+    def set_arp_mode(self, mode):
+        self.arp.mode = mode
+
+    def set_tempo(self, bpm):
+        self.arp.bpm = bpm
+        self.myLabelTempo.setText(f"Tempo: {bpm} BPM")
 
     def set_counter(self):
         self.v_label.setText(VERSION)
@@ -403,15 +657,101 @@ class Synthesizer(QMainWindow):
         self.t1.do_run = True
         self.t1.start()
 
+    def update_perf_overlay(self):
+        self.perf_label.setText(self.engine.profiler.report())
+
+    def stop_audio(self):
+        if self.t1 is not None:
+            self.t1.do_run = False
+
+    def start_inputs(self):
+        """Starts the optional global keyboard hook and MIDI input.
+
+        Keys typed into the window always play, through keyPressEvent.
+        """
+        for source in (KeyboardHookSource(self.keys), MidiSource(self.post_note)):
+            try:
+                source.start()
+            except Exception as e:  # optional, missing module or device
+                print(f"{type(source).__name__} not available: {e!r}")
+            else:
+                self.sources.append(source)
+
+    def keyPressEvent(self, event):
+        if not event.isAutoRepeat():
+            self.keys.press(event.text())
+
+    def keyReleaseEvent(self, event):
+        if not event.isAutoRepeat():
+            self.keys.release(event.text())
+
     def closeEvent(self, event):
+        for source in self.sources:
+            source.stop()
+        self.analyzer.stop()
         if self.t1 is not None:
             self.t1.do_run = False
             time.sleep(1)
             self.t1.join()
+        self.engine.close()
+        if self.engine.profiler.enabled:
+            print(self.engine.profiler.report())
+            if self.engine.note_cache is not None:
+                rate = self.engine.note_cache.hit_rate()
+                print(f"note cache: {rate:.0%} of blocks found")
+        if self.trace_path:
+            self.engine.profiler.export_trace(self.trace_path)
         event.accept()
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    synth = Synthesizer()
+    parser = argparse.ArgumentParser(description="PyQt synthesizer")
+    parser.add_argument(
+        "--voice-workers",
+        type=int,
+        default=0,
+        help="render the voices in this many processes",
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="show per-stage block timings"
+    )
+    parser.add_argument("--trace", help="write a Chrome trace JSON file on exit")
+    parser.add_argument("--rate", type=int, default=SAMPLE_RATE, choices=SAMPLE_RATES)
+    parser.add_argument("--block", type=int, default=BLOCK_SIZE, choices=BLOCK_SIZES)
+    parser.add_argument("--samples", help="sample library played by the Sample wave")
+    parser.add_argument(
+        "--low-latency",
+        action="store_true",
+        help="use the smallest block size this machine renders without xruns",
+    )
+    parser.add_argument(
+        "--float32",
+        action="store_true",
+        help="render in single precision, straight into the device's format",
+    )
+    parser.add_argument(
+        "--impulse", default="", help="WAV impulse response for the reverb"
+    )
+    parser.add_argument(
+        "--note-cache",
+        type=float,
+        default=0,
+        metavar="MB",
+        help=f"memory for notes rendered once and replayed, "
+        f"e.g. {NOTE_CACHE_BYTES // 2**20}; off by default",
+    )
+    args = parser.parse_args(app.arguments()[1:])
+    synth = Synthesizer(
+        voice_workers=args.voice_workers,
+        profile=args.profile,
+        trace=args.trace,
+        fs=args.rate,
+        block_size=args.block,
+        low_latency=args.low_latency,
+        samples=args.samples,
+        float32=args.float32,
+        impulse=args.impulse,
+        note_cache=int(args.note_cache * 2**20),
+    )
     sys.exit(app.exec_())
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from drive import OVERSAMPLING, Drive, drive_kernels
+
+
+class DriveLatencyTest(unittest.TestCase):
+    """Drive.latency against the delay of an impulse through the filters."""
+
+    def measure(self, factor, block=64, start=10):
+        drive = Drive(drive_kernels(factor), block)
+        x = np.zeros(8 * block)
+        x[start] = 1e-4  # small enough for tanh to stay linear
+        y = np.concatenate(
+            [
+                drive.process(x[i : i + block].copy(), 1e-3)
+                for i in range(0, len(x), block)
+            ]
+        )
+        return drive, y, start
+
+    def test_latency_is_the_impulse_peak(self):
+        for factor in OVERSAMPLING:
+            with self.subTest(factor=factor):
+                drive, y, start = self.measure(factor)
+                self.assertIsInstance(drive.latency, int)
+                self.assertEqual(np.argmax(np.abs(y)) - start, drive.latency)
+
+    def test_response_is_symmetric_about_the_latency(self):
+        # linear phase: the delay is exact, not just the nearest sample
+        for factor in OVERSAMPLING:
+            with self.subTest(factor=factor):
+                drive, y, start = self.measure(factor)
+                centre = start + drive.latency
+                side = drive.taps - 1
+                before = y[centre - side : centre]
+                after = y[centre + 1 : centre + side + 1]
+                np.testing.assert_allclose(before, after[::-1], atol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class VoiceBank:
+    """Fixed pool of synth voices stored as parallel NumPy arrays.
+
+    Every per-voice quantity lives in an array indexed by voice number so a
+    whole block can be rendered for all active voices at once.
+    """
+
+    def __init__(self, n_voices: int = 16) -> None:
+        self.n_voices = n_voices
+        self.note = np.full(n_voices, -1)  # key held by the voice, -1 when free
+        self.frequency = np.zeros(n_voices)
+        self.phase = np.zeros(n_voices)  # oscillator phase in cycles
+        self.played = np.zeros(n_voices, dtype=np.int64)  # samples since note-on
+        self.released = np.full(n_voices, -1, dtype=np.int64)  # samples since note-off
+        self.active = np.zeros(n_voices, dtype=bool)
+        self.started = np.zeros(n_voices, dtype=np.int64)  # allocation order
+        self._counter = 0
+
+    def _allocate(self) -> int:
+        free = np.flatnonzero(~self.active)
+        if len(free):
+            return int(free[0])
+        # voice stealing: the voice furthest into its release goes first,
+        # otherwise the oldest held note
+        releasing = np.flatnonzero(self.released >= 0)
+        if len(releasing):
+            return int(releasing[np.argmax(self.released[releasing])])
+        return int(np.argmin(self.started))
+
+    def voice_for(self, note: int) -> int:
+        """The voice ``note_on`` would play ``note`` on: the one already
+        holding it, else a free (or stolen) one."""
+        held = np.flatnonzero(self.active & (self.note == note))
+        return int(held[0]) if len(held) else self._allocate()
+
+    def note_on(self, note: int, frequency: float) -> int:
+        """Starts ``note`` on a free (or stolen) voice and returns its index."""
+        v = self.voice_for(note)
+        self.note[v] = note
+        self.frequency[v] = frequency
+        self.phase[v] = 0.0
+        self.played[v] = 0
+        self.released[v] = -1
+        self.active[v] = True
+        self._counter += 1
+        self.started[v] = self._counter
+        return v
+
+    def note_off(self, note: int) -> np.ndarray:
+        """Releases ``note`` and returns the voices that were holding it."""
+        held = np.flatnonzero(self.active & (self.note == note) & (self.released < 0))
+        self.released[held] = 0
+        return held
+
+    def transpose(self, ratio: float) -> None:
+        self.frequency[self.active] *= ratio
+
+    def advance(self, chunk: int) -> None:
+        """Moves all active voices forward by one block."""
+        self.played[self.active] += chunk
+        self.released[self.active & (self.released >= 0)] += chunk
+
+    def free(self, idx: np.ndarray) -> None:
+        """Returns voices ``idx`` to the pool once they have finished sounding."""
+        self.active[idx] = False
+        self.note[idx] = -1
+        self.released[idx] = -1
+
+    def active_voices(self) -> np.ndarray:
+        return np.flatnonzero(self.active)
+
+    def any_active(self) -> bool:
+        return bool(self.active.any())
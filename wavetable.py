@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+
+from buffers import ScratchBuffers
+
+TABLE_SIZE = 2048
+BASE_FREQUENCY = 20.0  # highest fundamental covered by the first mip level
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pyqt-synth")
+CACHE_VERSION = 1
+
+# harmonic amplitude of each waveform (k = 1, 2, 3, ...), scaled like the
+# old scipy.signal oscillators
+WAVES = {
+    "sinusoidal": lambda k: np.where(k == 1, 1.0, 0.0),
+    "triangle": lambda k: 0.707
+    * np.where(k % 2 == 1, 8 / np.pi**2 * (-1.0) ** ((k - 1) // 2) / k**2, 0.0),
+    "sawtooth": lambda k: 0.5 * 2 / (np.pi * k) * (-1.0) ** (k + 1),
+    "square": lambda k: 0.5 * np.where(k % 2 == 1, 4 / (np.pi * k), 0.0),
+}
+
+
+def build_tables(fs: int, wave: str) -> np.ndarray:
+    """Builds the mip-mapped tables of ``wave``, shape (levels, TABLE_SIZE + 1).
+
+    Level ``i`` holds only the harmonics that stay below Nyquist for every
+    fundamental up to ``BASE_FREQUENCY * 2**i``. The extra last column
+    repeats the first sample so interpolation never has to wrap.
+    """
+    nyq = fs / 2
+    n_levels = int(np.ceil(np.log2(nyq / BASE_FREQUENCY))) + 1
+    k = np.arange(1, TABLE_SIZE // 2)
+    amplitudes = WAVES[wave](k)
+
+    tables = np.zeros((n_levels, TABLE_SIZE + 1))
+    for level in range(n_levels):
+        n_harmonics = min(int(nyq // (BASE_FREQUENCY * 2**level)), len(k))
+        spectrum = np.zeros(TABLE_SIZE // 2 + 1, dtype=complex)
+        # sin(k x) terms live in the negative imaginary part of the rfft
+        spectrum[1 : n_harmonics + 1] = -0.5j * TABLE_SIZE * amplitudes[:n_harmonics]
+        tables[level, :-1] = np.fft.irfft(spectrum, TABLE_SIZE)
+    tables[:, -1] = tables[:, 0]
+    return tables
+
+
+class WavetableBank:
+    """Band-limited wavetable oscillators read through a per-voice phase."""
+
+    def __init__(self, fs: int, tables: dict) -> None:
+        self.fs = fs
+        self.tables = tables
+        self._flat_tables = {}
+
+    @classmethod
+    def load(cls, fs: int) -> "WavetableBank":
+        """Loads the tables for ``fs`` from the disk cache, building them if needed."""
+        path = os.path.join(CACHE_DIR, f"wavetables_v{CACHE_VERSION}_{fs}.npz")
+        try:
+            with np.load(path) as cached:
+                tables = {wave: cached[wave] for wave in WAVES}
+        except (OSError, KeyError, ValueError):
+            tables = {wave: build_tables(fs, wave) for wave in WAVES}
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                np.savez(path, **tables)
+            except OSError:
+                print("Warning: could not write the wavetable cache.")
+        return cls(fs, tables)
+
+    def _flat(self, wave, dtype):
+        # the levels of a wave end to end in the block's dtype, for np.take
+        key = (wave, np.dtype(dtype))
+        flat = self._flat_tables.get(key)
+        if flat is None:
+            flat = self._flat_tables[key] = self.tables[wave].astype(dtype).ravel()
+        return flat
+
+    def render(self, wave, phase, frequency, chunk, pitch=None, out=None, scratch=None):
+        """Renders ``chunk`` samples for each voice.
+
+        ``phase`` (in cycles) and ``frequency`` hold one value per voice;
+        ``pitch`` optionally scales every voice's frequency per sample.
+        Returns the (voices x chunk) block and the phase each voice ends on,
+        which the caller stores so the next block continues seamlessly.
+        The block is written into ``out`` when given, in its dtype, with the
+        intermediate arrays taken from the ScratchBuffers ``scratch``.
+        Phases are always tracked in float64.
+        """
+        tables = self.tables[wave]
+        rows = len(phase)
+        if out is None:
+            out = np.empty((rows, chunk))
+        if scratch is None:
+            scratch = ScratchBuffers()
+        increment = frequency / self.fs
+        top = frequency if pitch is None else frequency * pitch.max()
+        ratio = np.maximum(top, BASE_FREQUENCY) / BASE_FREQUENCY
+        level = np.minimum(np.ceil(np.log2(ratio)).astype(int), len(tables) - 1)
+
+        # every step below runs on operands of one shape and dtype, which
+        # numpy computes without temporary buffers
+        shape = (rows, chunk)
+        x = scratch.get("phase", rows, chunk, dtype=np.float64)
+        if pitch is None:
+            np.copyto(x, scratch.ramp(chunk))
+            end = chunk
+        else:
+            # phase advanced by the samples before each one
+            steps = scratch.get("steps", chunk, dtype=np.float64)
+            np.cumsum(pitch, out=steps)
+            end = steps[-1]
+            steps -= pitch
+            np.copyto(x, steps)
+        x *= scratch.fill("column", shape, increment[:, None], np.float64)
+        x += scratch.fill("column", shape, phase[:, None], np.float64)
+        x %= 1.0
+        x *= TABLE_SIZE
+        whole = scratch.get("whole", rows, chunk, dtype=np.float64)
+        np.modf(x, out=(x, whole))
+        i0 = scratch.fill("index", shape, whole, np.intp)
+
+        # rows of the flattened tables, mode="clip" keeps take unbuffered
+        flat = self._flat(wave, out.dtype)
+        i0 += scratch.fill(
+            "offset", shape, (level * (TABLE_SIZE + 1))[:, None], np.intp
+        )
+        np.take(flat, i0, out=out, mode="clip")
+        i0 += 1
+        b = scratch.get("next", rows, chunk, dtype=out.dtype)
+        np.take(flat, i0, out=b, mode="clip")
+        b -= out
+        b *= (
+            x if x.dtype == out.dtype else scratch.fill("fraction", shape, x, out.dtype)
+        )
+        out += b
+        return out, (phase + increment * end) % 1.0